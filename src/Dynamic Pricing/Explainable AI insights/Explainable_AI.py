@@ -1,23 +1,25 @@
 import os
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from dotenv import load_dotenv
 
 load_dotenv()
 # Set up the Groq client with your API key
 api_key = os.environ.get("GROQ_API_KEY")
-client = ChatGroq(api_key=api_key,model="deepseek-r1-distill-llama-70b",streaming=True,  # Enable streaming
-        callbacks=[StreamingStdOutCallbackHandler()])
+MODEL_NAME = os.getenv("EXPLAIN_MODEL", "deepseek-r1-distill-llama-70b")
+# Finished answers are reused for identical (normalised) prompts for this long
+CACHE_TTL = float(os.getenv("EXPLAIN_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("EXPLAIN_CACHE_MAX_ENTRIES", "1024"))
+client = ChatGroq(api_key=api_key,model=MODEL_NAME,streaming=True)  # Enable streaming
 
-def generate_with_deepseek_r1(prompt):
-    """
-    Generate text using DeepSeek R1 model via Groq.
-    The model will naturally show its reasoning process.
-    """
-    # Create a system message that encourages step-by-step reasoning
-    system_message = """You are DeepSeek R1, an AI assistant specialized in medical reasoning.
+# Create a system message that encourages step-by-step reasoning
+SYSTEM_MESSAGE = """You are DeepSeek R1, an AI assistant specialized in medical reasoning.
     When answering questions, first show your step-by-step reasoning process,
     then provide your final conclusion. I WANT YOU TO FOLLOW streaming approach And EVERYTIME GIVE YOUR URL REFERENCES AT THE END OF THE ANSWER.
 
@@ -59,31 +61,192 @@ MANDATORY DISCLAIMER:
 > Medical Notice: This is general medical information only.
 > Consult healthcare professionals for personal medical advice.
 > Emergency conditions require immediate medical attention."""
-    
-    # Create a prompt template
-    prompt_template = ChatPromptTemplate.from_messages([
-        ("system", system_message),
-        ("human", "{input}")
-    ])
-    
-    # Create the chain
-    chain = prompt_template | client | StrOutputParser()
+
+
+def normalise_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip().lower()
+
+
+class ThinkSplitter:
+    """Splits streamed DeepSeek R1 output into reasoning (inside <think>...</think>) and answer text.
+
+    Tags may arrive split across chunks, so a tail that could be the start of
+    a tag is held back until the next chunk.
+    """
+
+    OPEN, CLOSE = "<think>", "</think>"
+
+    def __init__(self):
+        self.in_reasoning = False
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        parts = []
+        while self._buffer:
+            tag = self.CLOSE if self.in_reasoning else self.OPEN
+            kind = "reasoning" if self.in_reasoning else "answer"
+            index = self._buffer.find(tag)
+            if index >= 0:
+                if index:
+                    parts.append((kind, self._buffer[:index]))
+                self._buffer = self._buffer[index + len(tag):]
+                self.in_reasoning = not self.in_reasoning
+                continue
+            keep = next((size for size in range(len(tag) - 1, 0, -1) if self._buffer.endswith(tag[:size])), 0)
+            emit = self._buffer[:len(self._buffer) - keep]
+            if emit:
+                parts.append((kind, emit))
+            self._buffer = self._buffer[len(emit):]
+            break
+        return parts
+
+    def flush(self):
+        parts = [("reasoning" if self.in_reasoning else "answer", self._buffer)] if self._buffer else []
+        self._buffer = ""
+        return parts
+
+
+def split_reasoning(text):
+    """(reasoning, answer) of a complete response"""
+    splitter = ThinkSplitter()
+    parts = splitter.feed(text) + splitter.flush()
+    reasoning = "".join(part for kind, part in parts if kind == "reasoning")
+    answer = "".join(part for kind, part in parts if kind == "answer")
+    return reasoning.strip(), answer.strip()
+
+
+class Explainer:
+    """Reusable explainer: the prompt | model | parser chain is built once.
+
+    astream() yields ("reasoning", text) and ("answer", text) pieces as the
+    model produces them; explain() and aexplain() return both parts at once.
+    Finished responses are cached by normalised prompt for `cache_ttl`
+    seconds, so repeated explanations cost nothing.
+    """
+
+    def __init__(self, llm=None, system_message=SYSTEM_MESSAGE, cache_ttl=CACHE_TTL, cache_max_entries=CACHE_MAX_ENTRIES):
+        prompt_template = ChatPromptTemplate.from_messages([
+            ("system", system_message),
+            ("human", "{input}")
+        ])
+        self.chain = prompt_template | (llm or client) | StrOutputParser()
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, prompt):
+        key = normalise_prompt(prompt)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and time.time() - entry["created"] < self.cache_ttl:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return {"reasoning": entry["reasoning"], "answer": entry["answer"]}
+            if entry:
+                del self._cache[key]
+            self.misses += 1
+            return None
+
+    def store(self, prompt, reasoning, answer):
+        if not answer:
+            # Output cut off before the answer (e.g. max_tokens spent on reasoning); let a retry ask again.
+            return
+        with self._lock:
+            self._cache[normalise_prompt(prompt)] = {"reasoning": reasoning, "answer": answer, "created": time.time()}
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    async def astream(self, prompt):
+        cached = self.cached(prompt)
+        if cached:
+            if cached["reasoning"]:
+                yield "reasoning", cached["reasoning"]
+            yield "answer", cached["answer"]
+            return
+        splitter = ThinkSplitter()
+        collected = {"reasoning": [], "answer": []}
+        async for chunk in self.chain.astream({"input": prompt}):
+            for kind, text in splitter.feed(chunk):
+                collected[kind].append(text)
+                yield kind, text
+        for kind, text in splitter.flush():
+            collected[kind].append(text)
+            yield kind, text
+        self.store(prompt, "".join(collected["reasoning"]).strip(), "".join(collected["answer"]).strip())
+
+    async def aexplain(self, prompt):
+        parts = {"reasoning": [], "answer": []}
+        async for kind, text in self.astream(prompt):
+            parts[kind].append(text)
+        return {kind: "".join(texts).strip() for kind, texts in parts.items()}
+
+    def explain(self, prompt):
+        cached = self.cached(prompt)
+        if cached:
+            return cached
+        reasoning, answer = split_reasoning(self.chain.invoke({"input": prompt}))
+        self.store(prompt, reasoning, answer)
+        return {"reasoning": reasoning, "answer": answer}
+
+
+_explainer = None
+_explainer_lock = threading.Lock()
+
+
+def get_explainer():
+    """Process-wide explainer, so every caller shares one chain and cache"""
+    global _explainer
+    with _explainer_lock:
+        if _explainer is None:
+            _explainer = Explainer()
+        return _explainer
+
+
+def generate_with_deepseek_r1(prompt):
+    """
+    Generate text using DeepSeek R1 model via Groq.
+    The model will naturally show its reasoning process.
+    """
     try:
-        return chain.invoke({"input": prompt})
+        result = get_explainer().explain(prompt)
+        if result["reasoning"]:
+            return f"<think>\n{result['reasoning']}\n</think>\n\n{result['answer']}"
+        return result["answer"]
     except Exception as e:
         return f"Error occurred: {str(e)}"
 
 
-# Example usage
-if __name__ == "__main__":
+async def print_explanation(prompt):
+    """Stream an explanation to stdout, reasoning first, then the answer"""
+    current = None
+    try:
+        async for kind, text in get_explainer().astream(prompt):
+            if kind != current:
+                print("\n--- Reasoning ---\n" if kind == "reasoning" else "\n--- Answer ---\n", flush=True)
+                current = kind
+            print(text, end="", flush=True)
+    except Exception as e:
+        print(f"Error occurred: {str(e)}")
+
+
+async def interactive_session():
+    """Question loop on a single event loop, so the client's async connections stay usable"""
     flag=True
     while(flag):
-        prompt = input("enter your question:")
-        response = generate_with_deepseek_r1(prompt)
-        print("/n")
-        answer=input("Do you want to continue:")
+        prompt = await asyncio.to_thread(input, "enter your question:")
+        await print_explanation(prompt)
+        print("\n")
+        answer=await asyncio.to_thread(input, "Do you want to continue:")
         if(answer.lower()=="no"):
             flag=False
 
-  
 
+# Example usage
+if __name__ == "__main__":
+    asyncio.run(interactive_session())
+
+  
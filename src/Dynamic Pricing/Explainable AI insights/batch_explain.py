@@ -0,0 +1,289 @@
+"""Batch explanations for dynamic-pricing decisions.
+
+Decisions are read from a .jsonl file ({"id", "old_price", "new_price",
+"features": {...}} per line) or a .csv file (id, old_price, new_price and one
+column per feature). Similar decisions -- same direction and size of change,
+same features at the same rounded values -- are grouped and explained with a
+single LLM call, whose explanation is written for every decision in the group.
+Numeric features are compared at FEATURE_PRECISION significant digits
+(default 2, so 100 and 104 group together but 100 and 149 do not); lower it
+with --precision for fewer, coarser groups. Calls run concurrently under a
+tokens-per-minute budget and are retried with backoff, as is a response that
+ends before its answer.
+
+One row per decision is appended to the output JSONL as each group finishes,
+which doubles as the checkpoint: re-running the same command after a crash
+skips decisions already written. Failed groups go to <output>.errors.jsonl
+and are retried on the next run.
+
+    python batch_explain.py decisions.csv --output explanations.jsonl --concurrency 8 --tpm 6000
+"""
+from __future__ import annotations
+import os
+import csv
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+from typing import Dict, List
+from langchain_groq import ChatGroq
+from Explainable_AI import Explainer, MODEL_NAME, api_key
+
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 2.0
+PROGRESS_EVERY = 10
+# Upper bound on each response; also what the token budget reserves per call.
+# DeepSeek R1 writes its <think> reasoning first, often several hundred tokens,
+# so this covers reasoning plus the short answer.
+MAX_OUTPUT_TOKENS = int(os.getenv("EXPLAIN_BATCH_MAX_TOKENS", "2048"))
+# Price changes are grouped in steps of this many percent (increases and decreases never share a group)
+CHANGE_STEP_PCT = float(os.getenv("EXPLAIN_BATCH_CHANGE_STEP", "5"))
+# Numeric features are compared at this many significant digits when grouping
+FEATURE_PRECISION = int(os.getenv("EXPLAIN_BATCH_PRECISION", "2"))
+
+PRICING_SYSTEM_MESSAGE = """You are a pricing analyst explaining decisions made by an automated dynamic pricing engine
+for event tickets. You are given a price change and the features the engine saw when it made it.
+Think through which features most plausibly drove the change, then answer in 2-4 plain sentences
+that a sales manager can read: name the main drivers, say whether the change is an increase or a
+decrease and by roughly how much, and mention any feature that worked against the change.
+Do not invent features that are not listed."""
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def load_decisions(path: str) -> List[dict]:
+    """[{"id", "old_price", "new_price", "features"}] from a .jsonl or .csv file"""
+    decisions = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                decisions.append({
+                    "id": row.pop("id"),
+                    "old_price": float(row.pop("old_price")),
+                    "new_price": float(row.pop("new_price")),
+                    "features": {name: _number(value) for name, value in row.items()},
+                })
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                decisions.append({
+                    "id": str(entry["id"]),
+                    "old_price": float(entry["old_price"]),
+                    "new_price": float(entry["new_price"]),
+                    "features": entry.get("features", {}),
+                })
+    return decisions
+
+
+def change_pct(decision: dict) -> float:
+    if not decision["old_price"]:
+        return 0.0
+    return (decision["new_price"] - decision["old_price"]) / decision["old_price"] * 100
+
+
+def _rounded(value, precision=FEATURE_PRECISION):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return float(f"{value:.{precision}g}")
+
+
+def decision_signature(decision: dict, change_step=CHANGE_STEP_PCT, precision=FEATURE_PRECISION) -> str:
+    """Grouping key: direction, size bucket of the change, and every feature at reduced precision"""
+    change = change_pct(decision)
+    direction = "up" if change > 0 else "down" if change < 0 else "flat"
+    magnitude = round(abs(change) / change_step) * change_step
+    features = sorted((name, _rounded(value, precision)) for name, value in decision["features"].items())
+    return json.dumps([direction, magnitude, features], default=str)
+
+
+def group_decisions(decisions: List[dict], change_step=CHANGE_STEP_PCT, precision=FEATURE_PRECISION) -> Dict[str, List[dict]]:
+    groups = {}
+    for decision in decisions:
+        groups.setdefault(decision_signature(decision, change_step, precision), []).append(decision)
+    return groups
+
+
+def group_prompt(decisions: List[dict]) -> str:
+    """One prompt describing the shared pattern of a group of decisions"""
+    changes = [change_pct(decision) for decision in decisions]
+    example = decisions[0]
+    lines = [
+        f"{len(decisions)} similar price decision(s).",
+        f"Price change: {min(changes):+.1f}% to {max(changes):+.1f}% "
+        f"(example: {example['old_price']:.2f} -> {example['new_price']:.2f})",
+        "Features:",
+    ]
+    for name in sorted(example["features"]):
+        values = [decision["features"].get(name) for decision in decisions]
+        numeric = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+        if len(numeric) == len(values) and min(numeric) != max(numeric):
+            lines.append(f"- {name}: {min(numeric):g} to {max(numeric):g}")
+        else:
+            lines.append(f"- {name}: {example['features'][name]}")
+    lines.append("Explain why the engine made this change.")
+    return "\n".join(lines)
+
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token for English prompts
+    return len(text) // 4 + 1
+
+
+class TokenBudget:
+    """Delays calls so the tokens reserved in any 60 second window stay under `per_minute`"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._window = deque()
+        self._lock = asyncio.Lock()
+
+    def _used(self, now):
+        while self._window and now - self._window[0][0] >= 60:
+            self._window.popleft()
+        return sum(tokens for _, tokens in self._window)
+
+    async def acquire(self, tokens: int):
+        if not self.per_minute:
+            return
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                used = self._used(now)
+                # A single call larger than the budget still runs, alone in its window.
+                if not self._window or used + tokens <= self.per_minute:
+                    self._window.append((now, tokens))
+                    return
+                delay = 60 - (now - self._window[0][0])
+            await asyncio.sleep(max(delay, 0.05))
+
+
+def drop_partial_line(path: str):
+    """Truncate an unterminated last line left by a crash mid-write, so appends start on a fresh line"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            keep = data.rfind(b"\n") + 1
+            print(f"{path}: dropping incomplete last line ({len(data) - keep} bytes)")
+            f.truncate(keep)
+
+
+def completed_ids(output: str) -> set:
+    if not os.path.exists(output):
+        return set()
+    done = set()
+    with open(output, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                print(f"{output}:{number}: skipping malformed checkpoint line")
+    return done
+
+
+async def explain_group(explainer: Explainer, key: str, decisions: List[dict], budget: TokenBudget, semaphore: asyncio.Semaphore) -> List[dict]:
+    """Explain one group; returns a row per decision, or a single error row for the group"""
+    prompt = group_prompt(decisions)
+    tokens = estimate_tokens(PRICING_SYSTEM_MESSAGE + prompt) + MAX_OUTPUT_TOKENS
+    last_error = None
+    async with semaphore:
+        for attempt in range(MAX_RETRIES):
+            await budget.acquire(tokens)
+            try:
+                result = await explainer.aexplain(prompt)
+                if not result["answer"]:
+                    raise ValueError("response ended before the answer (reasoning used up max_tokens)")
+                break
+            except Exception as e:
+                last_error = e
+                print(f"Group of {len(decisions)} ({decisions[0]['id']}...): attempt {attempt+1} failed: {str(e)}")
+                if attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+        else:
+            return [{"group": key, "ids": [decision["id"] for decision in decisions], "error": str(last_error), "time": time.time()}]
+    return [
+        {
+            "id": decision["id"],
+            "group": key,
+            "old_price": decision["old_price"],
+            "new_price": decision["new_price"],
+            "change_pct": round(change_pct(decision), 2),
+            "explanation": result["answer"],
+            "reasoning": result["reasoning"],
+        }
+        for decision in decisions
+    ]
+
+
+async def explain_batch(decisions: List[dict], output: str, concurrency: int = 8, tpm: int = 6000,
+                        change_step=CHANGE_STEP_PCT, precision=FEATURE_PRECISION, explainer: Explainer = None) -> dict:
+    """Explain every decision not already in `output`; returns run statistics"""
+    drop_partial_line(output)
+    drop_partial_line(output + ".errors.jsonl")
+    done = completed_ids(output)
+    pending = [decision for decision in decisions if decision["id"] not in done]
+    groups = group_decisions(pending, change_step, precision)
+    print(f"{len(decisions)} decisions, {len(done)} already done, {len(pending)} to explain in {len(groups)} groups")
+
+    if explainer is None:
+        llm = ChatGroq(api_key=api_key, model=MODEL_NAME, max_tokens=MAX_OUTPUT_TOKENS)
+        explainer = Explainer(llm=llm, system_message=PRICING_SYSTEM_MESSAGE)
+    budget = TokenBudget(tpm)
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"explained": 0, "failed": 0, "skipped": len(decisions) - len(pending), "groups": len(groups)}
+    start_time = time.time()
+    tasks = [explain_group(explainer, key, members, budget, semaphore) for key, members in groups.items()]
+    with open(output, "a", encoding="utf-8") as out, open(output + ".errors.jsonl", "a", encoding="utf-8") as errors:
+        for finished, task in enumerate(asyncio.as_completed(tasks), 1):
+            rows = await task
+            for row in rows:
+                target = errors if "error" in row else out
+                target.write(json.dumps(row) + "\n")
+                if "error" in row:
+                    stats["failed"] += len(row["ids"])
+                else:
+                    stats["explained"] += 1
+            out.flush()
+            errors.flush()
+            if finished % PROGRESS_EVERY == 0:
+                minutes = (time.time() - start_time) / 60
+                print(f"{finished}/{len(groups)} groups, {stats['explained'] / minutes:.1f} decisions/min")
+
+    minutes = (time.time() - start_time) / 60
+    stats["seconds"] = round(minutes * 60, 1)
+    stats["decisions_per_minute"] = round(stats["explained"] / minutes, 2) if minutes else 0.0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("decisions", help=".jsonl or .csv file of pricing decisions")
+    parser.add_argument("--output", default="explanations.jsonl")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("EXPLAIN_BATCH_CONCURRENCY", "8")))
+    parser.add_argument("--tpm", type=int, default=int(os.getenv("EXPLAIN_BATCH_TPM", "6000")), help="token-per-minute budget (0 = unlimited)")
+    parser.add_argument("--change-step", type=float, default=CHANGE_STEP_PCT, help="price change bucket width in percent")
+    parser.add_argument("--precision", type=int, default=FEATURE_PRECISION, help="significant digits of numeric features when grouping")
+    args = parser.parse_args()
+
+    decisions = load_decisions(args.decisions)
+    stats = asyncio.run(explain_batch(decisions, args.output, args.concurrency, args.tpm, args.change_step, args.precision))
+    print(
+        f"Explained {stats['explained']} in {stats['groups']} groups, failed {stats['failed']}, skipped {stats['skipped']} "
+        f"in {stats['seconds']}s ({stats['decisions_per_minute']} decisions/min)"
+    )
+
+
+if __name__ == "__main__":
+    main()
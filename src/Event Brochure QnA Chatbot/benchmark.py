@@ -0,0 +1,202 @@
+"""Offline benchmark for the brochure QnA pipeline.
+
+Generates a synthetic brochure, then measures ingestion (pages/sec), embedding
+(chunks/sec, cold and cached), retrieval latency and end-to-end turn latency
+with a deterministic fake LLM. Runs on a CPU-only box with no network and
+writes a JSON report that can be compared across commits:
+
+    python benchmark.py --pages 200 --output bench.json
+"""
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from pdf_processor import process_pdf, iter_pdf_chunks
+from retrieval import BM25Index, get_retriever
+from chatbot import init_chatbot
+
+WORDS = (
+    "keynote workshop hall registration sponsor booth lunch networking panel speaker ticket vip parking "
+    "venue schedule session track stage badge wifi refund policy gate shuttle hackathon award dinner"
+).split()
+QUESTIONS = [
+    "Where is the keynote held?",
+    "What time does registration open?",
+    "Is parking available at the venue?",
+    "What is the refund policy?",
+    "Which hall hosts the hackathon?",
+    "Does the VIP ticket include lunch?",
+    "When is the award dinner?",
+    "Where do I collect my badge?",
+]
+FOLLOW_UPS = ["And what about parking?", "Is it free?", "What time does that start?"]
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_synthetic_brochure(path, pages, lines_per_page=45, seed=0):
+    """Write a plain-text PDF with Helvetica pages of brochure-like sentences"""
+    rng = random.Random(seed)
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page in range(pages):
+        lines = [f"Event brochure page {page + 1}: Hall {page % 12 + 1}, Session {page}"]
+        lines += [" ".join(rng.choice(WORDS) for _ in range(12)) + "." for _ in range(lines_per_page)]
+        body = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(body)} >>\nstream\n{body}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def get_benchmark_embeddings(kind, dimension):
+    if kind == "local":
+        # Only works offline if the model is already in the local HF cache.
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    return DeterministicFakeEmbedding(size=dimension)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "results": {},
+    }
+    results = report["results"]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        pdf_path = os.path.join(workdir, "brochure.pdf")
+        write_synthetic_brochure(pdf_path, args.pages)
+
+        chunks, elapsed = timed(process_pdf, pdf_path)
+        results["ingest_eager"] = {"pages_per_s": round(args.pages / elapsed, 2), "seconds": round(elapsed, 4),
+                                   "chunks": len(chunks)}
+
+        first_batch = None
+        started = time.perf_counter()
+        streamed = 0
+        for batch in iter_pdf_chunks(pdf_path, workers=args.workers):
+            first_batch = first_batch or time.perf_counter() - started
+            streamed += len(batch)
+        elapsed = time.perf_counter() - started
+        results["ingest_streaming"] = {"pages_per_s": round(args.pages / elapsed, 2), "seconds": round(elapsed, 4),
+                                       "first_batch_s": round(first_batch or 0, 4), "chunks": streamed}
+
+        texts = [doc.page_content for doc in chunks]
+        embeddings = CacheBackedEmbeddings.from_bytes_store(
+            get_benchmark_embeddings(args.embeddings, args.dimension),
+            LocalFileStore(os.path.join(workdir, "embedding_cache")),
+            namespace="benchmark",
+            key_encoder="sha256",
+        )
+        for label in ("embed_cold", "embed_cached"):
+            _, elapsed = timed(embeddings.embed_documents, texts)
+            results[label] = {"chunks_per_s": round(len(texts) / elapsed, 2), "seconds": round(elapsed, 4)}
+
+        vectorstore = InMemoryVectorStore(embeddings)
+        vectorstore.add_documents(chunks)
+        lexical_index = BM25Index()
+        lexical_index.add_documents(chunks)
+
+        queries = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.queries)]
+        for mode in ("dense", "hybrid"):
+            retriever = get_retriever(vectorstore, lexical_index, mode=mode)
+            latencies = [timed(retriever.invoke, query)[1] for query in queries]
+            results[f"retrieval_{mode}"] = summarize(latencies)
+
+        llm = FakeListChatModel(responses=[f"Answer {i}." for i in range(16)], sleep=args.llm_delay)
+        chain = init_chatbot(vectorstore, llm=llm, retriever=get_retriever(vectorstore, lexical_index, mode=args.mode))
+        first_turn, follow_up = [], []
+        for i, query in enumerate(queries):
+            _, elapsed = timed(chain.invoke, {"input": query, "chat_history": []})
+            first_turn.append(elapsed)
+            history = [HumanMessage(content=query), AIMessage(content="Answer.")]
+            _, elapsed = timed(chain.invoke, {"input": FOLLOW_UPS[i % len(FOLLOW_UPS)], "chat_history": history})
+            follow_up.append(elapsed)
+        results["turn_first"] = summarize(first_turn)
+        results["turn_follow_up"] = summarize(follow_up)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--embeddings", choices=["fake", "local"], default="fake")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--mode", choices=["dense", "hybrid"], default="dense", help="retrieval mode for turns")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="seconds the fake LLM sleeps per token")
+    parser.add_argument("--output", default="benchmark_report.json")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,63 @@
 import os
+import re
+import threading
+from collections import OrderedDict
+from operator import itemgetter
 from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain.chains.combine_documents import create_stuff_documents_chain
+from history import ChatHistory
 
+REWRITE_CACHE_SIZE = 1024
+# Only the most recent turns are used to reformulate a follow-up question.
+REWRITE_HISTORY_MESSAGES = 6
 
-def init_chatbot(vectorstore):
-    llm = ChatGroq(
+# Words that usually point back at something said earlier in the conversation.
+BACK_REFERENCE = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|he|she|him|her|his|there|then|"
+    r"same|above|previous|earlier|former|latter|else|also|too|again|more|another|other)\b",
+    re.IGNORECASE,
+)
+FOLLOW_UP_OPENER = re.compile(r"^\s*(and|but|or|so|what about|how about|why|what if)\b", re.IGNORECASE)
+
+rewrite_metrics = {"turns": 0, "skipped": 0, "cache_hits": 0}
+# Guards rewrite_metrics and every rewrite cache; turns for different events run on concurrent threads
+rewrite_lock = threading.Lock()
+
+
+def get_llm():
+    return ChatGroq(
         groq_api_key=os.getenv("GROQ_API_KEY"),
         model_name="llama-3.1-70b-versatile"
     )
-    retriever = vectorstore.as_retriever()
+
+
+def needs_contextualization(question, chat_history):
+    """Whether a question has to be rewritten against the chat history before retrieval"""
+    if not chat_history:
+        return False
+    return bool(
+        BACK_REFERENCE.search(question)
+        or FOLLOW_UP_OPENER.search(question)
+        or len(question.split()) <= 2
+    )
+
+
+def rewrite_skip_rate():
+    with rewrite_lock:
+        return rewrite_metrics["skipped"] / rewrite_metrics["turns"] if rewrite_metrics["turns"] else 0.0
+
+
+def init_chatbot_stages(vectorstore, llm=None, retriever=None):
+    """Build the RAG chain as two stages so callers can act on the standalone question.
+
+    The contextualizer adds `standalone_question` to the inputs; the answer
+    chain retrieves with it and adds `context` and `answer`.
+    """
+    llm = llm or get_llm()
+    retriever = retriever or vectorstore.as_retriever()
 
     contextualize_q_system_prompt = (
         "Given the chat history and the latest user question about medical issues or health-related topics, "
@@ -27,10 +73,54 @@ def init_chatbot(vectorstore):
         ]
     )
 
-    # Create a history-aware retriever that will use LLM to contextualize queries
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
+    rewrite_chain = contextualize_q_prompt | llm | StrOutputParser()
+
+    rewrites = OrderedDict()
+
+    def plan_rewrite(inputs):
+        """Return (cache key, None) when the LLM must rewrite, else (None, standalone question)"""
+        # Standalone questions (and every first turn) go straight to the
+        # retriever; only real follow-ups pay for the rewrite LLM call.
+        question = inputs["input"]
+        if not needs_contextualization(question, inputs.get("chat_history")):
+            with rewrite_lock:
+                rewrite_metrics["turns"] += 1
+                rewrite_metrics["skipped"] += 1
+            return None, question
+        history = inputs["chat_history"][-REWRITE_HISTORY_MESSAGES:]
+        key = (tuple((m.type, m.content) for m in history), question)
+        with rewrite_lock:
+            rewrite_metrics["turns"] += 1
+            if key in rewrites:
+                rewrites.move_to_end(key)
+                rewrite_metrics["cache_hits"] += 1
+                return None, rewrites[key]
+        return key, None
+
+    def remember(key, standalone):
+        with rewrite_lock:
+            rewrites[key] = standalone
+            if len(rewrites) > REWRITE_CACHE_SIZE:
+                rewrites.popitem(last=False)
+        return standalone
+
+    def rewrite_inputs(inputs):
+        return {"input": inputs["input"], "chat_history": inputs["chat_history"][-REWRITE_HISTORY_MESSAGES:]}
+
+    def contextualize(inputs):
+        key, standalone = plan_rewrite(inputs)
+        if key is None:
+            return standalone
+        return remember(key, rewrite_chain.invoke(rewrite_inputs(inputs)))
+
+    async def acontextualize(inputs):
+        key, standalone = plan_rewrite(inputs)
+        if key is None:
+            return standalone
+        return remember(key, await rewrite_chain.ainvoke(rewrite_inputs(inputs)))
+
+    # Only uses the LLM to contextualize queries when needed
+    contextualizer = RunnablePassthrough.assign(standalone_question=RunnableLambda(contextualize, afunc=acontextualize))
 
     # System prompt for answering the user's question based on retrieved documents
     qa_system_prompt = (
@@ -54,20 +144,32 @@ def init_chatbot(vectorstore):
     # Combine documents and generate an answer using the LLM
     question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
 
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-    return rag_chain
+    answer_chain = RunnablePassthrough.assign(
+        context=(itemgetter("standalone_question") | retriever).with_config(run_name="retrieve_documents")
+    ).assign(answer=question_answer_chain)
+    return contextualizer, answer_chain
+
+
+def init_chatbot(vectorstore, llm=None, retriever=None):
+    contextualizer, answer_chain = init_chatbot_stages(vectorstore, llm, retriever)
+    return (contextualizer | answer_chain).with_config(run_name="retrieval_chain")
 
 
-def chat(rag_chain):
-    chat_history = []
+def chat(rag_chain, history=None, tracer=None):
+    history = history if history is not None else ChatHistory(get_llm())
     while True:
         query = input("You: ")
         if query.lower() in ["exit", "quit", "bye"]:
             break
         # Process the user's query through the retrieval chain
-        result = rag_chain.invoke({"input": query, "chat_history": chat_history})
+        inputs = {"input": query, "chat_history": history.messages}
+        if tracer is not None:
+            with tracer.turn() as turn:
+                result = rag_chain.invoke(inputs, config=turn.config)
+        else:
+            result = rag_chain.invoke(inputs)
         # Display the AI's response
         print(f"AI: {result['answer']}")
-        # Update the chat history
-        chat_history.append(HumanMessage(content=query))
-        chat_history.append(AIMessage(content=result["answer"]))
+        # Update the chat history (older turns are folded into a summary)
+        history.add_turn(query, result["answer"])
+    print(f"History rewrite skipped on {rewrite_skip_rate():.0%} of turns ({rewrite_metrics['cache_hits']} rewrite cache hits)")
@@ -0,0 +1,86 @@
+import os
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "300"))
+
+summarize_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You maintain a running summary of a conversation between an attendee and an event brochure assistant. "
+            "Update the summary with the new exchanges, keeping names, numbers, dates and open questions. "
+            "Reply with the updated summary only, in under {max_words} words.",
+        ),
+        ("human", "Current summary:\n{summary}\n\nNew exchanges:\n{exchanges}"),
+    ]
+)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting without a tokenizer.
+    return len(text) // 4 + 1
+
+
+class ChatHistory:
+    """Chat history with a bounded prompt footprint.
+
+    The last `keep_turns` turns are kept verbatim (fewer if they exceed the
+    token budget); older turns are folded into a rolling summary, one LLM call
+    per fold, covering only the turns that just fell out of the window. Without
+    an LLM, older turns are simply dropped.
+    """
+
+    def __init__(self, llm=None, max_tokens=HISTORY_TOKEN_BUDGET, keep_turns=HISTORY_KEEP_TURNS,
+                 summary_tokens=SUMMARY_TOKEN_BUDGET):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.turns = []
+        self._summarize = summarize_prompt | llm | StrOutputParser() if llm is not None else None
+
+    @property
+    def messages(self):
+        messages = []
+        if self.summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {self.summary}"))
+        for question, answer in self.turns:
+            messages.extend([HumanMessage(content=question), AIMessage(content=answer)])
+        return messages
+
+    def __len__(self):
+        return len(self.turns)
+
+    def _pop_overflow(self):
+        budget = self.max_tokens - estimate_tokens(self.summary)
+        overflow = []
+        while len(self.turns) > 1 and (
+            len(self.turns) > self.keep_turns
+            or sum(estimate_tokens(q) + estimate_tokens(a) for q, a in self.turns) > budget
+        ):
+            overflow.append(self.turns.pop(0))
+        return overflow
+
+    def _summary_inputs(self, overflow):
+        exchanges = "\n".join(f"User: {q}\nAssistant: {a}" for q, a in overflow)
+        return {"summary": self.summary or "(none)", "exchanges": exchanges, "max_words": self.summary_tokens * 3 // 4}
+
+    def _set_summary(self, summary):
+        # Hard cap in case the model ignores the length instruction.
+        self.summary = summary.strip()[: self.summary_tokens * 4]
+
+    def add_turn(self, question, answer):
+        self.turns.append((question, answer))
+        overflow = self._pop_overflow()
+        if overflow and self._summarize is not None:
+            self._set_summary(self._summarize.invoke(self._summary_inputs(overflow)))
+
+    async def aadd_turn(self, question, answer):
+        self.turns.append((question, answer))
+        overflow = self._pop_overflow()
+        if overflow and self._summarize is not None:
+            self._set_summary(await self._summarize.ainvoke(self._summary_inputs(overflow)))
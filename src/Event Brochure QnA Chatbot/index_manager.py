@@ -0,0 +1,192 @@
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+from pdf_processor import iter_pdf_chunks
+from vector_store import get_vector_store, get_embeddings, ingest_chunk_batches
+from chatbot import init_chatbot_stages, get_llm
+from semantic_cache import SemanticAnswerCache
+from retrieval import BM25Index, get_retriever, RETRIEVAL_MODE
+
+MAX_LOADED_EVENTS = int(os.getenv("MAX_LOADED_EVENTS", "256"))
+MEMORY_BUDGET_MB = int(os.getenv("INDEX_MEMORY_BUDGET_MB", "512"))
+
+# Rough resident cost of a loaded event (store handle, retriever, chain
+# objects). Components that keep per-event data in memory add to this.
+EVENT_BASE_BYTES = 64 * 1024
+
+
+class EventIndex:
+    """Everything needed to answer questions for one event's brochure"""
+
+    def __init__(self, event_id, vectorstore, contextualizer, answer_chain, answer_cache=None, lexical_index=None):
+        self.event_id = event_id
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.contextualizer = contextualizer
+        self.answer_chain = answer_chain
+        self.rag_chain = contextualizer | answer_chain
+        self.answer_cache = answer_cache
+
+    @property
+    def nbytes(self):
+        return (
+            EVENT_BASE_BYTES
+            + (self.answer_cache.nbytes if self.answer_cache else 0)
+            + (self.lexical_index.nbytes if self.lexical_index else 0)
+        )
+
+
+class EventIndexManager:
+    """Serves many events from one process, one collection per event.
+
+    Collections are loaded on first use and kept in LRU order; the least
+    recently used ones are evicted once either the event count or the
+    estimated memory budget is exceeded. The embedding model and LLM client
+    are shared by every event. Pass a tracing.RAGTracer to trace each turn.
+    """
+
+    def __init__(self, max_events=MAX_LOADED_EVENTS, memory_budget_mb=MEMORY_BUDGET_MB, llm=None,
+                 answer_cache=True, tracer=None):
+        self.max_events = max_events
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.llm = llm or get_llm()
+        self.answer_cache = answer_cache
+        self.tracer = tracer
+        self._loaded = OrderedDict()
+        self._lock = threading.RLock()
+        # One lock per event being loaded, so concurrent first requests share a load
+        self._loading = {}
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def _load(self, event_id):
+        vectorstore = get_vector_store(namespace=event_id)
+        lexical_index = BM25Index.load(event_id) if RETRIEVAL_MODE == "hybrid" else None
+        retriever = get_retriever(vectorstore, lexical_index)
+        contextualizer, answer_chain = init_chatbot_stages(vectorstore, llm=self.llm, retriever=retriever)
+        answer_cache = SemanticAnswerCache(get_embeddings()) if self.answer_cache else None
+        return EventIndex(event_id, vectorstore, contextualizer, answer_chain, answer_cache, lexical_index)
+
+    def _evict_over_budget(self):
+        while len(self._loaded) > 1 and (
+            len(self._loaded) > self.max_events or self.memory_usage() > self.memory_budget
+        ):
+            event_id, _ = self._loaded.popitem(last=False)
+            self.stats["evictions"] += 1
+            print(f"Evicted event {event_id} from index cache")
+
+    def _cached(self, event_id):
+        with self._lock:
+            if event_id not in self._loaded:
+                return None
+            self._loaded.move_to_end(event_id)
+            self.stats["hits"] += 1
+            return self._loaded[event_id]
+
+    def get(self, event_id):
+        event_index = self._cached(event_id)
+        if event_index is not None:
+            return event_index
+        with self._lock:
+            load_lock = self._loading.setdefault(event_id, threading.Lock())
+        # Loading happens outside the shared lock, so a slow collection only
+        # holds up requests for its own event.
+        with load_lock:
+            event_index = self._cached(event_id)
+            if event_index is not None:
+                return event_index
+            try:
+                event_index = self._load(event_id)
+                with self._lock:
+                    self._loaded[event_id] = event_index
+                    self.stats["loads"] += 1
+                    self._evict_over_budget()
+            finally:
+                with self._lock:
+                    self._loading.pop(event_id, None)
+            return event_index
+
+    def evict(self, event_id):
+        with self._lock:
+            self._loaded.pop(event_id, None)
+
+    def memory_usage(self):
+        return sum(event_index.nbytes for event_index in self._loaded.values())
+
+    def ingest(self, event_id, pdf_path):
+        """(Re-)ingest an event's brochure into its own collection"""
+        ingest_chunk_batches(get_vector_store(namespace=event_id), iter_pdf_chunks(pdf_path), namespace=event_id)
+        # Drop any loaded copy (and its cached answers) so the next request
+        # sees the new brochure.
+        with self._lock:
+            event_index = self._loaded.pop(event_id, None)
+        if event_index is not None and event_index.answer_cache:
+            event_index.answer_cache.clear()
+
+    def _record_cache(self, turn, hit):
+        if self.tracer is not None:
+            self.tracer.record_cache("answer", hit, turn)
+
+    def invoke(self, event_id, inputs):
+        if self.tracer is None:
+            return self._invoke(self.get(event_id), inputs)
+        with self.tracer.turn(event_id=event_id) as turn:
+            return self._invoke(self.get(event_id), inputs, turn)
+
+    def _invoke(self, event_index, inputs, turn=None):
+        config = turn.config if turn else None
+        if not event_index.answer_cache:
+            return event_index.rag_chain.invoke(inputs, config=config)
+
+        inputs = event_index.contextualizer.invoke(inputs, config=config)
+        question = inputs["standalone_question"]
+        vector = event_index.answer_cache.embed(question)
+        cached = event_index.answer_cache.lookup(question, vector)
+        self._record_cache(turn, cached is not None)
+        if cached is not None:
+            return {**inputs, **cached}
+        result = event_index.answer_chain.invoke(inputs, config=config)
+        event_index.answer_cache.store(question, result, vector)
+        return result
+
+    async def astream(self, event_id, inputs):
+        """Async variant of invoke that streams the answer.
+
+        Yields ("token", text) pieces as the LLM produces them, then a single
+        ("done", result) with the same dict invoke() would return.
+        """
+        turn = self.tracer.start_turn(event_id=event_id) if self.tracer else None
+        config = turn.config if turn else None
+        error = None
+        try:
+            event_index = await asyncio.to_thread(self.get, event_id)
+            inputs = await event_index.contextualizer.ainvoke(inputs, config=config)
+            question = inputs["standalone_question"]
+            answer_cache = event_index.answer_cache
+            if answer_cache:
+                vector = await asyncio.to_thread(answer_cache.embed, question)
+                cached = answer_cache.lookup(question, vector)
+                self._record_cache(turn, cached is not None)
+                if cached is not None:
+                    yield "token", cached["answer"]
+                    yield "done", {**inputs, **cached}
+                    return
+
+            result = dict(inputs)
+            answer = []
+            async for chunk in event_index.answer_chain.astream(inputs, config=config):
+                if "context" in chunk:
+                    result["context"] = chunk["context"]
+                if "answer" in chunk:
+                    answer.append(chunk["answer"])
+                    yield "token", chunk["answer"]
+            result["answer"] = "".join(answer)
+            if answer_cache:
+                answer_cache.store(question, result, vector)
+            yield "done", result
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if turn is not None:
+                self.tracer.finish_turn(turn, error)
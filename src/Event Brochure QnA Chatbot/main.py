@@ -1,26 +1,51 @@
 import os
+import threading
 from dotenv import load_dotenv
-from pdf_processor import process_pdf
-from vector_store import get_or_create_vector_store, get_vector_store
+
+# Loaded before the local modules, which read their settings at import time.
+load_dotenv()
+
+from pdf_processor import process_pdf, iter_pdf_chunks
+from vector_store import get_or_create_vector_store, get_vector_store, ingest_chunk_batches
 from chatbot import init_chatbot, chat
+from retrieval import BM25Index, HybridRetriever, get_retriever
+from tracing import RAGTracer
 
 
 def main():
-    load_dotenv()
-
     # Uncomment the following lines to upload a new PDF file
     pdf_path = os.getenv("PDF_PATH")
     if not pdf_path:
         raise ValueError("Please set the PDF_PATH environment variable.")
 
-    texts = process_pdf(pdf_path)
-    vectorstore = get_or_create_vector_store(texts)
+    if os.getenv("STREAM_INGEST", "").lower() in ("1", "true", "yes"):
+        # Keep ingesting in the background and start answering as soon as the
+        # first batch of chunks is searchable.
+        vectorstore = get_vector_store()
+        ready = threading.Event()
+        # The previous lexical index (if any) serves until this ingest completes,
+        # then the retriever switches to the freshly written one.
+        retriever = get_retriever(vectorstore, BM25Index.load() or BM25Index())
+
+        def ingest():
+            ingest_chunk_batches(vectorstore, iter_pdf_chunks(pdf_path), ready=ready)
+            if isinstance(retriever, HybridRetriever):
+                retriever.lexical_index = BM25Index.load()
+                print("Lexical index updated")
+
+        threading.Thread(target=ingest, daemon=True).start()
+        ready.wait()
+    else:
+        texts = process_pdf(pdf_path)
+        vectorstore = get_or_create_vector_store(texts)
+        retriever = get_retriever(vectorstore, BM25Index.load())
 
     # vector_store = get_vector_store()
 
-    chain = init_chatbot(vectorstore)
+    chain = init_chatbot(vectorstore, retriever=retriever)
 
-    chat(chain)
+    # Set TRACE_FILE to write a JSONL trace record per turn.
+    chat(chain, tracer=RAGTracer(os.getenv("TRACE_FILE")) if os.getenv("TRACE_FILE") else None)
 
 
 if __name__ == "__main__":
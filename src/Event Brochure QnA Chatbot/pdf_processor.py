@@ -1,10 +1,66 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+# Splitter settings are part of the embedding cache key, so changing them
+# invalidates previously cached chunk embeddings.
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+PAGES_PER_TASK = 8
+BATCH_SIZE = 64
+
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
 def process_pdf(pdf_path):
     loader = PyPDFLoader(pdf_path)
     documents = loader.load()
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    text_splitter = get_text_splitter()
     texts = text_splitter.split_documents(documents)
     print("Extracted text from PDF and tokenised it")
-    return texts
\ No newline at end of file
+    return texts
+
+
+def _extract_pages(pdf_path, start, stop):
+    # Runs in a worker process; each worker opens its own reader so only the
+    # requested pages are ever parsed there.
+    reader = PdfReader(pdf_path)
+    return [(i, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def iter_pdf_chunks(pdf_path, batch_size=BATCH_SIZE, workers=None, pages_per_task=PAGES_PER_TASK):
+    """Lazily parse a PDF across a process pool and yield chunk batches in page order.
+
+    Produces the same chunks as process_pdf (pages are split one at a time),
+    but only a bounded window of pages is held in memory at once.
+    """
+    workers = workers or os.cpu_count() or 1
+    page_count = len(PdfReader(pdf_path).pages)
+    text_splitter = get_text_splitter()
+
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        next_page = 0
+        while pending or next_page < page_count:
+            while next_page < page_count and len(pending) < workers * 2:
+                stop = min(next_page + pages_per_task, page_count)
+                pending.append(pool.submit(_extract_pages, pdf_path, next_page, stop))
+                next_page = stop
+
+            for page, text in pending.popleft().result():
+                page_doc = Document(page_content=text, metadata={"source": pdf_path, "page": page})
+                batch.extend(text_splitter.split_documents([page_doc]))
+                while len(batch) >= batch_size:
+                    yield batch[:batch_size]
+                    batch = batch[batch_size:]
+    if batch:
+        yield batch
+    print(f"Streamed {page_count} pages from PDF")
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import math
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Any, List, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", ".lexical_index")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK = os.getenv("RERANK", "").lower() in ("1", "true", "yes")
+HYBRID_K = int(os.getenv("HYBRID_K", "3"))
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted BM25 index over brochure chunks, loaded from the JSONL file written at ingest time"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self.lengths = []
+        self.postings = defaultdict(list)
+
+    def add_documents(self, documents):
+        for doc in documents:
+            doc_id = len(self.documents)
+            terms = Counter(tokenize(doc.page_content))
+            self.documents.append(doc)
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((doc_id, tf))
+
+    def search(self, query, k=HYBRID_FETCH_K):
+        n = len(self.documents)
+        if not n:
+            return []
+        avg_length = sum(self.lengths) / n
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+        return [self.documents[doc_id] for doc_id in ranked]
+
+    @property
+    def nbytes(self):
+        # Text plus roughly 16 bytes per posting entry.
+        return sum(len(doc.page_content) for doc in self.documents) + 16 * sum(len(p) for p in self.postings.values())
+
+    @staticmethod
+    def path_for(namespace):
+        return os.path.join(LEXICAL_INDEX_DIR, f"{namespace or 'default'}.jsonl")
+
+    @classmethod
+    def load(cls, namespace=None):
+        """Load the index for a collection, or None if it was never ingested with one"""
+        path = cls.path_for(namespace)
+        if not os.path.exists(path):
+            return None
+        index = cls()
+        with open(path, encoding="utf-8") as f:
+            index.add_documents(Document(**json.loads(line)) for line in f if line.strip())
+        return index
+
+
+class LexicalIndexWriter:
+    """Writes a collection's BM25 chunks to disk batch by batch during ingest.
+
+    Chunks go to a .partial file as they arrive, so ingest memory stays flat;
+    commit() swaps it in for the previous index, discard() drops it.
+    """
+
+    def __init__(self, namespace=None):
+        os.makedirs(LEXICAL_INDEX_DIR, exist_ok=True)
+        self.path = BM25Index.path_for(namespace)
+        self.partial_path = self.path + ".partial"
+        self._file = open(self.partial_path, "w", encoding="utf-8")
+
+    def add_documents(self, documents):
+        for doc in documents:
+            self._file.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata}) + "\n")
+        self._file.flush()
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+
+
+@lru_cache(maxsize=None)
+def get_reranker():
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(RERANK_MODEL)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    scores = defaultdict(float)
+    documents = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = (doc.metadata.get("source"), doc.page_content)
+            documents.setdefault(key, doc)
+            scores[key] += 1.0 / (k + rank + 1)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense vector search and BM25 fused with reciprocal rank fusion, optionally reranked"""
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = HYBRID_K
+    fetch_k: int = HYBRID_FETCH_K
+    rerank: bool = RERANK
+
+    def _get_relevant_documents(self, query, *, run_manager=None) -> List[Document]:
+        dense = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        sparse = self.lexical_index.search(query, k=self.fetch_k)
+        candidates = reciprocal_rank_fusion([dense, sparse])
+        if self.rerank and candidates:
+            candidates = candidates[: self.fetch_k]
+            scores = get_reranker().predict([(query, doc.page_content) for doc in candidates])
+            candidates = [doc for _, doc in sorted(zip(scores, candidates), key=lambda pair: pair[0], reverse=True)]
+        return candidates[: self.k]
+
+
+def get_retriever(vectorstore, lexical_index: Optional[BM25Index] = None, mode=RETRIEVAL_MODE):
+    """Hybrid retriever when requested and a lexical index exists, else plain dense retrieval"""
+    if mode == "hybrid" and lexical_index is not None:
+        return HybridRetriever(vectorstore=vectorstore, lexical_index=lexical_index)
+    return vectorstore.as_retriever()
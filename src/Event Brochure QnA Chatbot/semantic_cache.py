@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+import numpy as np
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(6 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+
+
+class SemanticAnswerCache:
+    """Answers for one event, looked up by similarity of the standalone question.
+
+    A lookup returns a stored answer (with its source chunks) when an earlier
+    question embeds within `threshold` cosine similarity and is younger than
+    `ttl` seconds. Call clear() whenever the event's brochure is re-ingested.
+    Embed the question once with embed() and pass the vector to both
+    lookup() and store(), so a miss costs a single embedding call.
+    """
+
+    def __init__(self, embeddings, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = []
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop_expired(self, now):
+        fresh = [entry for entry in self._entries if now - entry["created"] < self.ttl]
+        if len(fresh) != len(self._entries):
+            self._entries = fresh
+            self._matrix = None
+
+    def lookup(self, question, vector=None):
+        vector = self.embed(question) if vector is None else vector
+        with self._lock:
+            self._drop_expired(time.time())
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix = np.stack([entry["vector"] for entry in self._entries])
+                scores = self._matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    entry = self._entries[best]
+                    return {"answer": entry["answer"], "context": entry["context"], "cached_question": entry["question"]}
+            self.misses += 1
+            return None
+
+    def store(self, question, result, vector=None):
+        entry = {
+            "vector": self.embed(question) if vector is None else vector,
+            "question": question,
+            "answer": result["answer"],
+            "context": result.get("context", []),
+            "created": time.time(),
+        }
+        with self._lock:
+            self._entries.append(entry)
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._matrix = None
+
+    @property
+    def nbytes(self):
+        return sum(
+            entry["vector"].nbytes + len(entry["answer"]) + sum(len(doc.page_content) for doc in entry["context"])
+            for entry in self._entries
+        )
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel
+
+# Loaded before the local modules, which read their settings at import time.
+load_dotenv()
+
+from index_manager import EventIndexManager
+from history import ChatHistory
+from tracing import RAGTracer
+from chatbot import rewrite_metrics
+
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "3600"))
+
+
+class SessionStore:
+    """Bounded set of per-session chat histories, dropped least-recently-used first or when idle.
+
+    Each history comes with an asyncio.Lock; hold it for a whole turn so
+    concurrent requests on one session cannot interleave history appends and
+    summary folding.
+    """
+
+    def __init__(self, new_history, max_sessions=MAX_SESSIONS, idle_ttl=SESSION_IDLE_TTL):
+        self.new_history = new_history
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            now = time.time()
+            while self._sessions:
+                oldest_key, (_, _, last_used) = next(iter(self._sessions.items()))
+                if now - last_used < self.idle_ttl:
+                    break
+                del self._sessions[oldest_key]
+            history, lock, _ = self._sessions.pop(key, (None, None, now))
+            if history is None:
+                history, lock = self.new_history(), asyncio.Lock()
+            self._sessions[key] = (history, lock, now)
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return history, lock
+
+
+class ChatRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+
+app = FastAPI(title="Event Brochure QnA")
+tracer = RAGTracer()
+tracer.add_metric("rag_history_rewrite_turns_total", "Turns seen by the history rewrite step",
+                  lambda: rewrite_metrics["turns"], "counter")
+tracer.add_metric("rag_history_rewrite_skipped_total", "Turns that skipped the rewrite LLM call",
+                  lambda: rewrite_metrics["skipped"], "counter")
+tracer.add_metric("rag_history_rewrite_cache_hits_total", "Rewrites served from the rewrite cache",
+                  lambda: rewrite_metrics["cache_hits"], "counter")
+manager = EventIndexManager(tracer=tracer)
+sessions = SessionStore(lambda: ChatHistory(manager.llm))
+
+
+def _sources(result):
+    return [doc.metadata for doc in result.get("context", [])]
+
+
+async def _answer(event_id, session_id, message):
+    history, lock = sessions.get((event_id, session_id))
+    # Turns on the same session run one at a time, each seeing the previous one's history.
+    async with lock:
+        async for kind, payload in manager.astream(event_id, {"input": message, "chat_history": history.messages}):
+            yield kind, payload
+            if kind == "done":
+                # Runs after the client already has the full answer, so folding
+                # old turns into the summary never delays a response.
+                await history.aadd_turn(message, payload["answer"])
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return tracer.render_metrics()
+
+
+@app.post("/events/{event_id}/chat")
+async def chat_sse(event_id: str, request: ChatRequest):
+    session_id = request.session_id or uuid.uuid4().hex
+
+    async def events():
+        async for kind, payload in _answer(event_id, session_id, request.message):
+            if kind == "token":
+                yield f"data: {json.dumps({'token': payload})}\n\n"
+            else:
+                done = {"session_id": session_id, "answer": payload["answer"], "sources": _sources(payload)}
+                yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.websocket("/events/{event_id}/ws")
+async def chat_ws(websocket: WebSocket, event_id: str):
+    await websocket.accept()
+    session_id = websocket.query_params.get("session_id") or uuid.uuid4().hex
+    try:
+        while True:
+            message = (await websocket.receive_json()).get("message", "")
+            if not message:
+                continue
+            async for kind, payload in _answer(event_id, session_id, message):
+                if kind == "token":
+                    await websocket.send_json({"type": "token", "token": payload})
+                else:
+                    await websocket.send_json(
+                        {"type": "done", "session_id": session_id, "answer": payload["answer"], "sources": _sources(payload)}
+                    )
+    except WebSocketDisconnect:
+        pass
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "8000")))
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACE_FILE = os.getenv("TRACE_FILE")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CHUNK_BUCKETS = (1, 2, 3, 4, 5, 8, 10, 20)
+CHARS_BUCKETS = (500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# Run names of the RAG chain pieces, mapped to the stage they are reported as.
+CHAIN_STAGES = {
+    "contextualize": "contextualize",
+    "format_inputs": "stuffing",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        self.values[_label_key(labels)] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        counts, total = self.series.get(key, ([0] * len(self.buckets), [0, 0.0]))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        total[0] += 1
+        total[1] += value
+        self.series[key] = (counts, total)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, (count, value_sum)) in sorted(self.series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', f'{bound:g}')])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {value_sum:g}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class RAGTracer(BaseCallbackHandler):
+    """Per-stage timings, token counts, retrieval sizes and cache hits for the RAG chain.
+
+    Attach it to a call through a turn, which also writes one JSONL trace
+    record per turn when a trace file is configured:
+
+        with tracer.turn(event_id="expo") as turn:
+            rag_chain.invoke(inputs, config=turn.config)
+
+    Aggregates are exposed in Prometheus text format by render_metrics().
+    """
+
+    run_inline = True
+
+    def __init__(self, trace_file=TRACE_FILE):
+        self.trace_file = trace_file
+        self.stage_seconds = Histogram("rag_stage_seconds", "Wall time per RAG stage", SECONDS_BUCKETS)
+        self.turn_seconds = Histogram("rag_turn_seconds", "End-to-end wall time per turn", SECONDS_BUCKETS)
+        self.llm_tokens = Counter("rag_llm_tokens_total", "LLM tokens by stage and kind")
+        self.retrieved_chunks = Histogram("rag_retrieved_chunks", "Chunks returned per retrieval", CHUNK_BUCKETS)
+        self.retrieved_chars = Histogram("rag_retrieved_chars", "Characters returned per retrieval", CHARS_BUCKETS)
+        self.cache_lookups = Counter("rag_cache_lookups_total", "Cache lookups by cache and result")
+        self.extra_metrics = []
+        self._runs = {}
+        self._turns = {}
+        self._lock = threading.Lock()
+
+    # -- turns -------------------------------------------------------------
+
+    def start_turn(self, **attributes):
+        turn = Turn(self, attributes)
+        with self._lock:
+            self._turns[turn.trace_id] = turn
+        return turn
+
+    def finish_turn(self, turn, error=None):
+        with self._lock:
+            self._turns.pop(turn.trace_id, None)
+        duration = time.perf_counter() - turn.started
+        self.turn_seconds.observe(duration)
+        if not self.trace_file:
+            return
+        record = {
+            "trace_id": turn.trace_id,
+            "timestamp": turn.timestamp,
+            "duration_s": round(duration, 6),
+            **turn.attributes,
+            "stages": turn.stages,
+            "tokens": turn.tokens,
+            "retrieval": turn.retrieval,
+            "cache": turn.cache,
+        }
+        if error is not None:
+            record["error"] = repr(error)
+        with self._lock, open(self.trace_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    @contextmanager
+    def turn(self, **attributes):
+        turn = self.start_turn(**attributes)
+        try:
+            yield turn
+        except BaseException as e:
+            self.finish_turn(turn, error=e)
+            raise
+        self.finish_turn(turn)
+
+    def record_cache(self, cache, hit, turn=None):
+        result = "hit" if hit else "miss"
+        self.cache_lookups.inc(cache=cache, result=result)
+        if turn is not None:
+            turn.cache[cache] = result
+
+    # -- callbacks ---------------------------------------------------------
+
+    def _start(self, run_id, parent_run_id, name, stage, metadata):
+        parent = self._runs.get(parent_run_id)
+        ancestry = (parent["ancestry"] if parent else ()) + (name,)
+        trace_id = (metadata or {}).get("trace_id") or (parent["trace_id"] if parent else None)
+        self._runs[run_id] = {
+            "ancestry": ancestry,
+            "stage": stage,
+            "trace_id": trace_id,
+            "started": time.perf_counter(),
+        }
+
+    def _end(self, run_id):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return None, None
+        turn = self._turns.get(run["trace_id"])
+        if run["stage"]:
+            elapsed = time.perf_counter() - run["started"]
+            self.stage_seconds.observe(elapsed, stage=run["stage"])
+            if turn is not None:
+                turn.stages[run["stage"]] = turn.stages.get(run["stage"], 0.0) + round(elapsed, 6)
+        return run, turn
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "")
+        self._start(run_id, parent_run_id, name, CHAIN_STAGES.get(name), metadata)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def _llm_stage(self, parent_run_id):
+        parent = self._runs.get(parent_run_id)
+        ancestry = parent["ancestry"] if parent else ()
+        if "contextualize" in ancestry:
+            return "rewrite_llm"
+        if "stuff_documents_chain" in ancestry:
+            return "generation"
+        return "llm"
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", self._llm_stage(parent_run_id), metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, "llm", self._llm_stage(parent_run_id), metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run, turn = self._end(run_id)
+        if run is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += metadata.get("input_tokens", 0)
+                    completion_tokens += metadata.get("output_tokens", 0)
+        self.llm_tokens.inc(prompt_tokens, stage=run["stage"], kind="prompt")
+        self.llm_tokens.inc(completion_tokens, stage=run["stage"], kind="completion")
+        if turn is not None:
+            tokens = turn.tokens.setdefault(run["stage"], {"prompt": 0, "completion": 0})
+            tokens["prompt"] += prompt_tokens
+            tokens["completion"] += completion_tokens
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(run_id, parent_run_id, "retriever", "retrieval", metadata)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        run, turn = self._end(run_id)
+        chars = sum(len(doc.page_content) for doc in documents)
+        self.retrieved_chunks.observe(len(documents))
+        self.retrieved_chars.observe(chars)
+        if turn is not None:
+            turn.retrieval = {"chunks": len(documents), "chars": chars}
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    # -- export ------------------------------------------------------------
+
+    def add_metric(self, name, help_text, read, metric_type="gauge"):
+        """Export a value owned elsewhere (e.g. a module-level counter) alongside the tracer's own"""
+        self.extra_metrics.append((name, help_text, read, metric_type))
+
+    def render_metrics(self):
+        lines = []
+        for metric in (self.stage_seconds, self.turn_seconds, self.llm_tokens, self.retrieved_chunks,
+                       self.retrieved_chars, self.cache_lookups):
+            lines.extend(metric.render())
+        for name, help_text, read, metric_type in self.extra_metrics:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {read():g}"])
+        return "\n".join(lines) + "\n"
+
+
+class Turn:
+    """One traced question/answer; pass `config` to the chain calls it covers"""
+
+    def __init__(self, tracer, attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.attributes = attributes
+        self.stages = {}
+        self.tokens = {}
+        self.retrieval = {}
+        self.cache = {}
+        self.config = {"callbacks": [tracer], "metadata": {"trace_id": self.trace_id}}
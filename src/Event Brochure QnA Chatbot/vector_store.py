@@ -0,0 +1,115 @@
+import os
+import hashlib
+from functools import lru_cache
+from pinecone import Pinecone, ServerlessSpec
+from langchain_pinecone import PineconeVectorStore
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
+from pdf_processor import CHUNK_SIZE, CHUNK_OVERLAP
+from retrieval import LexicalIndexWriter
+
+INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "event-brochure")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+# Cached vectors are only valid for the model and splitter that produced them,
+# so both are folded into the cache namespace.
+CACHE_NAMESPACE = f"{EMBEDDING_MODEL}:{CHUNK_SIZE}:{CHUNK_OVERLAP}"
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """Sentence-transformer embeddings backed by an on-disk, content-addressed cache.
+
+    Shared process-wide so every event collection reuses one loaded model.
+    """
+    underlying = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    store = LocalFileStore(EMBEDDING_CACHE_DIR)
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying, store, namespace=hashlib.sha256(CACHE_NAMESPACE.encode()).hexdigest(),
+        key_encoder="sha256",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_index():
+    pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    if INDEX_NAME not in pc.list_indexes().names():
+        pc.create_index(
+            name=INDEX_NAME,
+            dimension=EMBEDDING_DIMENSION,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region=os.getenv("PINECONE_REGION", "us-east-1")),
+        )
+    return pc.Index(INDEX_NAME)
+
+
+def chunk_id(doc):
+    """Stable id for a chunk: its source file plus a hash of content and splitter settings"""
+    source = os.path.basename(doc.metadata.get("source", "document"))
+    digest = hashlib.sha256(f"{CACHE_NAMESPACE}\n{doc.page_content}".encode()).hexdigest()
+    return f"{source}#{digest}"
+
+
+def ingest_chunk_batches(vectorstore, batches, ready=None, namespace=None):
+    """Index chunk batches as they arrive, skipping chunks that are already stored.
+
+    Existing ids are listed per source the first time that source is seen, and
+    any that were not produced this run are deleted once all batches are in.
+    `ready` (a threading.Event) is set after the first batch is searchable.
+    `namespace` must match the one the vectorstore was created with.
+    The chunks of this run are written batch by batch to the collection's BM25
+    index file, which replaces the previous one once ingest completes.
+    """
+    index = get_index()
+    existing = set()
+    seen_sources = set()
+    seen = set()
+    lexical_writer = LexicalIndexWriter(namespace)
+    added = 0
+    try:
+        for batch in batches:
+            chunks = {}
+            for doc in batch:
+                cid = chunk_id(doc)
+                if cid not in seen:
+                    chunks.setdefault(cid, doc)
+
+            for source in {cid.split("#", 1)[0] for cid in chunks} - seen_sources:
+                seen_sources.add(source)
+                for ids in index.list(prefix=f"{source}#", namespace=namespace):
+                    existing.update(ids)
+
+            seen.update(chunks)
+            lexical_writer.add_documents(chunks.values())
+            new_ids = [cid for cid in chunks if cid not in existing]
+            if new_ids:
+                vectorstore.add_documents([chunks[cid] for cid in new_ids], ids=new_ids)
+                added += len(new_ids)
+            if ready is not None:
+                ready.set()
+
+        # Diff against what was already indexed so an unchanged brochure
+        # upserts nothing and an edited one only touches changed chunks.
+        stale = list(existing - seen)
+        if stale:
+            vectorstore.delete(ids=stale)
+        lexical_writer.commit()
+    finally:
+        lexical_writer.discard()
+        if ready is not None:
+            ready.set()
+
+    print(f"Vector store ready: {added} new chunks, {len(seen) - added} unchanged, {len(stale)} removed")
+    return vectorstore
+
+
+def get_or_create_vector_store(texts, namespace=None):
+    return ingest_chunk_batches(get_vector_store(namespace), [texts], namespace=namespace)
+
+
+def get_vector_store(namespace=None):
+    """Store for one collection; each event lives in its own Pinecone namespace"""
+    return PineconeVectorStore(index=get_index(), embedding=get_embeddings(), namespace=namespace)
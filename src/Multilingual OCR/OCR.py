@@ -1,31 +1,48 @@
 from __future__ import annotations
+import asyncio
 import base64
+import hashlib
+import io
+import json
 import os
-from typing import List
+import time
+from functools import lru_cache
+from typing import List, Optional
 from datetime import date, datetime
 from langchain.chains import TransformChain
 from langchain_core.messages import HumanMessage
 from langchain_openai import ChatOpenAI
 from langchain import globals
-from langchain_core.runnables import chain
+from langchain_core.runnables import RunnableConfig, RunnableLambda, RunnablePassthrough
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.pydantic_v1 import BaseModel, Field
 from dotenv import load_dotenv
 import streamlit as st
 import pandas as pd
+from PIL import Image, ImageOps
+from validation import repair_json, normalise_record, NOT_AVAILABLE
 
 load_dotenv()
 AIPROXY_TOKEN = os.getenv("AIPROXY_TOKEN")
+MODEL_NAME = os.getenv("OCR_MODEL", "gpt-4o-mini")
+BASE_URL = os.getenv("OCR_BASE_URL", "https://aiproxy.sanand.workers.dev/openai/v1")
+# Connections kept open by the shared client (used by batch extraction)
+MAX_CONNECTIONS = int(os.getenv("OCR_MAX_CONNECTIONS", "16"))
+# The vision model scales high-detail images to fit 2048px, then to 768px on the
+# short side, so larger uploads only cost bandwidth.
+MAX_LONG_SIDE = int(os.getenv("OCR_MAX_LONG_SIDE", "2048"))
+MAX_SHORT_SIDE = int(os.getenv("OCR_MAX_SHORT_SIDE", "768"))
+JPEG_QUALITY = int(os.getenv("OCR_JPEG_QUALITY", "85"))
+# Formats the API accepts as-is when no resizing is needed
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
 globals.set_debug(False)
 
-st.set_page_config(layout="wide")
+# styles.css next to this script unless overridden
+STYLES_PATH = os.getenv("OCR_STYLES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "styles.css"))
 
 def local_css(file_name):
     with open(file_name) as f:
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-local_css("C:\AI_PROJECTS\SPECTRUM+PSG\styles.css")
-
-# Use raw string for file path
 
 
 class MedicationItem(BaseModel):
@@ -36,38 +53,103 @@ class MedicationItem(BaseModel):
 
 class PrescriptionInformations(BaseModel):
     patient_name: str = Field(description="Patient's name")
-    patient_age: int = Field(description="Patient's age")
+    patient_age: Optional[int] = Field(description="Patient's age in years (null if not legible)")
     patient_gender: str = Field(description="Patient's gender")
     doctor_name: str = Field(description="Doctor's name")
     doctor_license: str = Field(description="Doctor's license number")
-    prescription_date: datetime = Field(description="Date of the prescription")
+    prescription_date: Optional[datetime] = Field(description="Date of the prescription (null if not legible)")
     medications: List[MedicationItem] = []
     additional_notes: str = Field(description="Additional notes or instructions")
 
 # Initialize parser at the beginning
 parser = JsonOutputParser(pydantic_object=PrescriptionInformations)
 
+def prepare_image(raw: bytes) -> tuple[bytes, str]:
+    """Downsample to what the vision model uses and re-encode; returns (bytes, MIME type).
+
+    The real format is read from the file contents, not its extension. Files
+    that are already small enough, upright and in an accepted format are sent
+    unchanged without being decoded.
+    """
+    image = Image.open(io.BytesIO(raw))
+    image_format = image.format
+    # EXIF orientation 1 means the pixels are stored upright; anything else must be rotated
+    # before sending, so the raw bytes can only go through when no transpose is needed.
+    upright = image.getexif().get(0x0112, 1) == 1
+    scale = min(1.0, MAX_LONG_SIDE / max(image.size), MAX_SHORT_SIDE / min(image.size))
+    passthrough = upright and scale == 1.0 and image_format in PASSTHROUGH_FORMATS
+    if passthrough:
+        return raw, PASSTHROUGH_FORMATS[image_format]
+    oriented = image if upright else ImageOps.exif_transpose(image)
+    if scale < 1.0:
+        oriented = oriented.resize((round(oriented.width * scale), round(oriented.height * scale)), Image.LANCZOS)
+    if oriented.mode in ("RGBA", "LA", "P"):
+        background = Image.new("RGB", oriented.size, "white")
+        background.paste(oriented.convert("RGBA"), mask=oriented.convert("RGBA").getchannel("A"))
+        oriented = background
+    buffered = io.BytesIO()
+    oriented.convert("RGB").save(buffered, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    encoded = buffered.getvalue()
+    return encoded, "image/jpeg"
+
 def load_images(inputs: dict) -> dict:
+    """Read, downsample, re-encode and de-duplicate the pages; returns data URLs"""
     image_paths = inputs["image_paths"]
-
-    def encode_image(image_path):
+    start_time = time.time()
+    seen = set()
+    images = []
+    original_bytes = sent_bytes = duplicates = 0
+    for image_path in image_paths:
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            raw = image_file.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest in seen:
+            duplicates += 1
+            continue
+        seen.add(digest)
+        encoded, mime = prepare_image(raw)
+        original_bytes += len(raw)
+        sent_bytes += len(encoded)
+        images.append(f"data:{mime};base64,{base64.b64encode(encoded).decode('utf-8')}")
+    print(
+        f"Prepared {len(images)} image(s) ({duplicates} duplicate(s) skipped): "
+        f"{original_bytes / 1024:.0f} KB -> {sent_bytes / 1024:.0f} KB in {time.time() - start_time:.2f}s"
+    )
+    return {"images": images}
 
-    images_base64 = [encode_image(image_path) for image_path in image_paths]
-    return {"images": images_base64}
+async def aload_images(inputs: dict) -> dict:
+    """load_images on a worker thread, so concurrent batch documents are decoded and encoded in parallel"""
+    return await asyncio.to_thread(load_images, inputs)
 
 load_images_chain = TransformChain(
     input_variables=["image_paths"],
     output_variables=["images"],
-    transform=load_images
+    transform=load_images,
+    atransform=aload_images
 )
 
-@chain
-def image_model(inputs: dict) -> str | list[str] | dict:
-    """Invoke model with images and prompt."""
-    model = ChatOpenAI(api_key=os.environ["AIPROXY_TOKEN"], model="gpt-4o-mini",base_url="https://aiproxy.sanand.workers.dev/openai/v1")
-    image_urls = [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img}"}} for img in inputs['images']]
+@lru_cache(maxsize=1)
+def get_model() -> ChatOpenAI:
+    """One client per process, so its HTTP connection pools are reused across calls.
+
+    The sync pool serves the Streamlit app; the async pool serves batch extraction.
+    """
+    import httpx
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+    return ChatOpenAI(
+        api_key=os.environ["AIPROXY_TOKEN"],
+        model=MODEL_NAME,
+        base_url=BASE_URL,
+        http_client=httpx.Client(limits=limits),
+        http_async_client=httpx.AsyncClient(limits=limits),
+    )
+
+def image_content(images: List[str]) -> List[dict]:
+    return [{"type": "image_url", "image_url": {"url": url}} for url in images]
+
+def vision_messages(images: List[str]) -> List[HumanMessage]:
+    """The extraction prompt with the prepared page images"""
+    image_urls = image_content(images)
     prompt = """
     You are an expert medical transcriptionist specializing in deciphering and accurately transcribing handwritten medical prescriptions. Your role is to meticulously analyze the provided prescription images and extract all relevant information with the highest degree of precision.
 
@@ -137,19 +219,112 @@ def image_model(inputs: dict) -> str | list[str] | dict:
     Prescription images:
     {images_content}
     """
-    msg = model.invoke(
-    [HumanMessage(
+    return [HumanMessage(
         content=[
             {"type": "text", "text": prompt},
             {"type": "text", "text": parser.get_format_instructions()},
             *image_urls
         ]
-    )],
-    temperature=0.5,   
-    stop=None,  
-    )
+    )]
+
+def log_vision_request(images: List[str], start_time: float):
+    payload_kb = sum(len(url) for url in images) / 1024
+    print(f"Vision request with {payload_kb:.0f} KB of images took {time.time() - start_time:.2f}s")
+
+def invoke_vision(inputs: dict) -> str | list[str] | dict:
+    """Invoke model with images and prompt."""
+    start_time = time.time()
+    msg = get_model().invoke(vision_messages(inputs['images']), temperature=0.5, stop=None)
+    log_vision_request(inputs['images'], start_time)
+    return msg.content
+
+async def ainvoke_vision(inputs: dict) -> str | list[str] | dict:
+    start_time = time.time()
+    msg = await get_model().ainvoke(vision_messages(inputs['images']), temperature=0.5, stop=None)
+    log_vision_request(inputs['images'], start_time)
     return msg.content
 
+# Sync calls (the app) use the sync pool, ainvoke (batch extraction) the async one
+image_model = RunnableLambda(invoke_vision, afunc=ainvoke_vision)
+
+REASK_PROMPT = """
+From the prescription images, read only these fields: {fields}.
+Reply with a JSON object with exactly these keys. Use "Not available" for anything that is not clearly legible.
+Give patient_age as a number of years and prescription_date as YYYY-MM-DD.
+For medications, give a list of objects with name, dosage, frequency and duration.
+"""
+
+def reask_messages(images: List[str], fields: List[str]) -> List[HumanMessage]:
+    return [HumanMessage(content=[
+        {"type": "text", "text": REASK_PROMPT.format(fields=", ".join(fields))},
+        *image_content(images)
+    ])]
+
+def reask_missing_fields(images: List[str], fields: List[str]) -> dict:
+    """Ask the model again for a few fields only, with a short prompt"""
+    msg = get_model().invoke(reask_messages(images, fields), temperature=0)
+    return repair_json(msg.content)
+
+async def areask_missing_fields(images: List[str], fields: List[str]) -> dict:
+    msg = await get_model().ainvoke(reask_messages(images, fields), temperature=0)
+    return repair_json(msg.content)
+
+def parse_output(inputs: dict) -> tuple[dict, dict, List[str]]:
+    """(parsed data, normalised record, fields still missing) for the model's first answer"""
+    try:
+        data = repair_json(inputs["raw_output"])
+    except ValueError as e:
+        print(f"Unrecoverable model output, re-asking for all fields: {str(e)}")
+        data = {}
+    record, missing = normalise_record(data)
+    if not data and "medications" not in missing:
+        missing.append("medications")
+    if missing:
+        print(f"Re-asking for missing fields: {', '.join(missing)}")
+    return data, record, missing
+
+def check_output(inputs: dict) -> dict:
+    """Repair and coerce the model output locally, re-asking only for fields still missing."""
+    data, record, missing = parse_output(inputs)
+    if missing:
+        try:
+            data = {**data, **reask_missing_fields(inputs["images"], missing)}
+            record, missing = normalise_record(data)
+        except Exception as e:
+            print(f"Re-ask failed: {str(e)}")
+    return finish_record(record, missing)
+
+async def acheck_output(inputs: dict, config: RunnableConfig) -> dict:
+    """Async check_output. A re-ask is a second vision request, so it waits on the
+    caller's `rate_limiter` and is logged to its `reask_log` list when those are
+    passed in the config's "configurable" dict (see batch_extract.py)."""
+    data, record, missing = parse_output(inputs)
+    if missing:
+        configurable = config.get("configurable", {})
+        if configurable.get("reask_log") is not None:
+            configurable["reask_log"].append(list(missing))
+        if configurable.get("rate_limiter") is not None:
+            await configurable["rate_limiter"].wait()
+        try:
+            data = {**data, **await areask_missing_fields(inputs["images"], missing)}
+            record, missing = normalise_record(data)
+        except Exception as e:
+            print(f"Re-ask failed: {str(e)}")
+    return finish_record(record, missing)
+
+def finish_record(record: dict, missing: List[str]) -> dict:
+    for field in missing:
+        if field == "medications":
+            # Keep what was read; absent medication fields are already "Not available".
+            continue
+        record[field] = None if field in ("patient_age", "prescription_date") else NOT_AVAILABLE
+    return json.loads(PrescriptionInformations.parse_obj(record).json())
+
+validate_output = RunnableLambda(check_output, afunc=acheck_output)
+
+# Built once; every call reuses the same runnables and pooled client
+vision_chain = load_images_chain | RunnablePassthrough.assign(raw_output=image_model) | validate_output
+
 def get_prescription_informations(image_paths: List[str]) -> dict:
     parser = JsonOutputParser(pydantic_object=PrescriptionInformations)
     vision_prompt = """
@@ -161,10 +336,12 @@ def get_prescription_informations(image_paths: List[str]) -> dict:
     - Additional notes or instructions
     Note: If portions of the image are not clear then leave the values as empty. Do not make up the values.
     """
-    vision_chain = load_images_chain | image_model | parser
     return vision_chain.invoke({'image_paths': image_paths, 'prompt': vision_prompt})
 
 def main():
+    st.set_page_config(layout="wide")
+    if os.path.exists(STYLES_PATH):
+        local_css(STYLES_PATH)
     st.title('Medical Prescription Parsing')
 
     global parser
@@ -0,0 +1,204 @@
+"""Batch prescription extraction over a folder or manifest of scanned forms.
+
+Every document goes through the same vision chain as the Streamlit app
+(one pooled client), with requests run concurrently under a requests-per-
+minute limit that also covers re-asks for missing fields. Validated records
+are appended to a JSONL file as they finish, which doubles as the
+checkpoint: re-running the same command skips documents already written.
+Failures go to <output>.errors.jsonl and are retried on the next run.
+
+    python batch_extract.py scans/ --output prescriptions.jsonl --concurrency 8 --rpm 120 --parquet prescriptions.parquet
+
+A manifest is a .txt file with one image path per line, or a .jsonl file
+with {"id": ..., "image_paths": [...]} per line for multi-page documents.
+"""
+from __future__ import annotations
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from OCR import vision_chain, PrescriptionInformations
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 2.0
+PROGRESS_EVERY = 25
+
+
+def load_documents(source: str) -> List[dict]:
+    """[{"id", "image_paths"}] from a folder of images or a manifest file"""
+    if os.path.isdir(source):
+        return [
+            {"id": name, "image_paths": [os.path.join(source, name)]}
+            for name in sorted(os.listdir(source))
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+    base = os.path.dirname(os.path.abspath(source))
+    documents = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if source.endswith(".jsonl"):
+                entry = json.loads(line)
+                paths = entry.get("image_paths") or [entry["path"]]
+                documents.append({"id": str(entry.get("id", paths[0])), "image_paths": paths})
+            else:
+                documents.append({"id": line, "image_paths": [line]})
+    for document in documents:
+        document["image_paths"] = [os.path.join(base, path) for path in document["image_paths"]]
+    return documents
+
+
+def drop_partial_line(path: str):
+    """Truncate an unterminated last line left by a crash mid-write, so appends start on a fresh line"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            keep = data.rfind(b"\n") + 1
+            print(f"{path}: dropping incomplete last line ({len(data) - keep} bytes)")
+            f.truncate(keep)
+
+
+def completed_ids(output: str) -> set:
+    if not os.path.exists(output):
+        return set()
+    done = set()
+    with open(output, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                done.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                print(f"{output}:{number}: skipping malformed checkpoint line")
+    return done
+
+
+def validate(result: dict) -> dict:
+    """Check a chain result against PrescriptionInformations; returns a JSON-ready dict"""
+    record = PrescriptionInformations.parse_obj(result)
+    return json.loads(record.json())
+
+
+class RateLimiter:
+    """Spaces request starts so no more than `per_minute` begin in any minute"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def extract_document(document: dict, limiter: RateLimiter, semaphore: asyncio.Semaphore) -> dict:
+    """Extract one document; returns a record row, or an error row.
+
+    Failed calls are retried with backoff. A result that fails validation is
+    not re-requested: it is kept in the error row for inspection. Re-asks for
+    missing fields share the rate limit and are listed in "reasked_fields".
+    """
+    last_error = None
+    reasks = []
+    config = {"configurable": {"rate_limiter": limiter, "reask_log": reasks}}
+    async with semaphore:
+        for attempt in range(MAX_RETRIES):
+            await limiter.wait()
+            try:
+                result = await vision_chain.ainvoke({"image_paths": document["image_paths"]}, config=config)
+                break
+            except Exception as e:
+                last_error = e
+                print(f"{document['id']}: attempt {attempt+1} failed: {str(e)}")
+                if attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+        else:
+            return {"id": document["id"], "error": str(last_error), "reasked_fields": reasks, "time": time.time()}
+    try:
+        return {"id": document["id"], "image_paths": document["image_paths"], "record": validate(result), "reasked_fields": reasks}
+    except Exception as e:
+        return {"id": document["id"], "error": str(e), "result": result, "reasked_fields": reasks, "time": time.time()}
+
+
+async def extract_batch(documents: List[dict], output: str, concurrency: int = 8, rpm: float = 60) -> dict:
+    """Extract every document not already in `output`; returns run statistics"""
+    drop_partial_line(output)
+    drop_partial_line(output + ".errors.jsonl")
+    done = completed_ids(output)
+    pending = [document for document in documents if document["id"] not in done]
+    print(f"{len(documents)} documents, {len(done)} already done, {len(pending)} to process")
+
+    # Page loading and encoding run in the loop's executor; the model calls are async.
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    limiter = RateLimiter(rpm)
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"processed": 0, "failed": 0, "reasks": 0, "skipped": len(documents) - len(pending)}
+    start_time = time.time()
+    tasks = [extract_document(document, limiter, semaphore) for document in pending]
+    with open(output, "a", encoding="utf-8") as out, open(output + ".errors.jsonl", "a", encoding="utf-8") as errors:
+        for task in asyncio.as_completed(tasks):
+            row = await task
+            target = errors if "error" in row else out
+            target.write(json.dumps(row) + "\n")
+            target.flush()
+            stats["failed" if "error" in row else "processed"] += 1
+            stats["reasks"] += len(row["reasked_fields"])
+            finished = stats["processed"] + stats["failed"]
+            if finished % PROGRESS_EVERY == 0:
+                minutes = (time.time() - start_time) / 60
+                print(f"{finished}/{len(pending)} documents, {stats['processed'] / minutes:.1f} docs/min")
+
+    minutes = (time.time() - start_time) / 60
+    stats["seconds"] = round(minutes * 60, 1)
+    stats["docs_per_minute"] = round(stats["processed"] / minutes, 2) if minutes else 0.0
+    return stats
+
+
+def write_parquet(output: str, parquet_path: str):
+    """Flatten the JSONL records into a Parquet table (medications kept as a nested list)"""
+    import pandas as pd
+
+    with open(output, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    df = pd.DataFrame([{"id": row["id"], "image_paths": row["image_paths"], **row["record"]} for row in rows])
+    df.to_parquet(parquet_path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="folder of images, .txt manifest of paths or .jsonl manifest of documents")
+    parser.add_argument("--output", default="prescriptions.jsonl")
+    parser.add_argument("--parquet", help="also write the records to this Parquet file")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("OCR_BATCH_CONCURRENCY", "8")))
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("OCR_BATCH_RPM", "60")), help="max requests per minute (0 = unlimited)")
+    args = parser.parse_args()
+
+    documents = load_documents(args.source)
+    stats = asyncio.run(extract_batch(documents, args.output, args.concurrency, args.rpm))
+    print(
+        f"Processed {stats['processed']}, failed {stats['failed']}, skipped {stats['skipped']}, re-asked {stats['reasks']} "
+        f"in {stats['seconds']}s ({stats['docs_per_minute']} docs/min)"
+    )
+    if args.parquet:
+        write_parquet(args.output, args.parquet)
+        print(f"Wrote {args.parquet}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Local repair and coercion of the vision model's prescription JSON.
+
+Everything here runs without calling the model: near-valid JSON is fixed up,
+fields like "42y" or "01/04/2023" are converted to the schema's types, and
+whatever still cannot be read is reported so the caller can re-ask for just
+those fields.
+"""
+from __future__ import annotations
+import re
+import ast
+import json
+from datetime import datetime
+from typing import List, Tuple
+
+NOT_AVAILABLE = "Not available"
+REQUIRED_FIELDS = ["patient_name", "patient_age", "patient_gender", "doctor_name",
+                   "doctor_license", "prescription_date", "additional_notes"]
+MEDICATION_FIELDS = ["name", "dosage", "frequency", "duration"]
+# Keys the model sometimes uses instead of the schema's
+FIELD_ALIASES = {
+    "patient_full_name": "patient_name",
+    "age": "patient_age",
+    "gender": "patient_gender",
+    "sex": "patient_gender",
+    "doctor_full_name": "doctor_name",
+    "doctor_license_number": "doctor_license",
+    "license_number": "doctor_license",
+    "date": "prescription_date",
+    "notes": "additional_notes",
+    "medication_name": "name",
+    "dose": "dosage",
+}
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y",
+                "%d.%m.%y", "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y", "%b %d %Y", "%B %d %Y"]
+
+
+def _scan_object(text: str) -> Tuple[str, bool]:
+    """Cut `text` (starting at "{") to its first complete JSON object.
+
+    Quotes are tracked, so braces inside string values do not count. If the
+    object never closes (output cut off), everything after the last complete
+    value is dropped -- including a half-written key/value, so that field
+    reads as missing rather than truncated -- and the open brackets are
+    closed. Returns (object text, whether it was truncated).
+    """
+    closers = []
+    quote = None
+    escaped = False
+    safe_end, safe_closers = 0, []
+    for index, char in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+            safe_end, safe_closers = index + 1, list(closers)
+        elif char in "}]":
+            if closers:
+                closers.pop()
+            if not closers:
+                return text[:index + 1], False
+            safe_end, safe_closers = index + 1, list(closers)
+        elif char == ",":
+            safe_end, safe_closers = index, list(closers)
+    return text[:safe_end] + "".join(reversed(safe_closers)), True
+
+
+def repair_json(text: str) -> dict:
+    """Parse model output that is JSON or nearly so; raises ValueError if nothing can be recovered"""
+    text = re.sub(r"^```(?:json)?|```$", "", text.strip(), flags=re.MULTILINE).strip()
+    start = text.find("{")
+    if start < 0:
+        raise ValueError("No JSON object in model output")
+    text, truncated = _scan_object(text[start:])
+    if truncated:
+        print("Model output was cut off; dropped the incomplete last field")
+    fixed, _ = _scan_object(text.replace("“", '"').replace("”", '"').replace("’", "'"))
+    candidates = [text, re.sub(r",\s*([}\]])", r"\1", fixed)]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            pass
+        try:
+            # Python-style dicts: single quotes, None/True/False
+            value = ast.literal_eval(candidate)
+            if isinstance(value, dict):
+                return value
+        except (ValueError, SyntaxError):
+            pass
+    raise ValueError("Model output is not valid JSON and could not be repaired")
+
+
+def is_missing(value) -> bool:
+    return value is None or (isinstance(value, str) and value.strip() == "")
+
+
+def coerce_age(value):
+    """42, "42", "42y", "42 yrs", "42 years", "Age: 42" -> 42; None if there is no plausible age"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if 0 <= value < 130 else None
+    if isinstance(value, str):
+        match = re.search(r"\d{1,3}", value)
+        if match and int(match.group()) < 130:
+            return int(match.group())
+    return None
+
+
+def coerce_date(value):
+    """ISO and common day-first date strings -> datetime; None if unreadable"""
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return None
+    text = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", value.strip())
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def _rename(data: dict) -> dict:
+    renamed = {}
+    for key, value in data.items():
+        key = re.sub(r"[^a-z0-9]+", "_", str(key).lower().replace("'s", "")).strip("_")
+        renamed[FIELD_ALIASES.get(key, key)] = value
+    return renamed
+
+
+def normalise_record(data: dict) -> Tuple[dict, List[str]]:
+    """Coerce a parsed result towards PrescriptionInformations.
+
+    Returns the cleaned dict and the fields that are still missing or could
+    not be converted. Fields the model marked "Not available" count as
+    answered; an unreadable age or date becomes None. A medication without
+    one of its keys (e.g. cut off mid-item) reports "medications" as missing.
+    """
+    record = _rename(data)
+    missing = []
+    for field in REQUIRED_FIELDS:
+        value = record.get(field)
+        if is_missing(value):
+            missing.append(field)
+            continue
+        if field == "patient_age":
+            record[field] = coerce_age(value)
+            if record[field] is None and not (isinstance(value, str) and NOT_AVAILABLE.lower() in value.lower()):
+                missing.append(field)
+        elif field == "prescription_date":
+            record[field] = coerce_date(value)
+            if record[field] is None and not (isinstance(value, str) and NOT_AVAILABLE.lower() in value.lower()):
+                missing.append(field)
+        elif isinstance(value, list):
+            record[field] = "\n".join(f"- {item}" for item in value)
+        elif not isinstance(value, str):
+            record[field] = str(value)
+
+    medications = record.get("medications") or []
+    if isinstance(medications, dict):
+        medications = [medications]
+    medications = [_rename(item) for item in medications if isinstance(item, dict)]
+    if any(field not in item for item in medications for field in MEDICATION_FIELDS):
+        missing.append("medications")
+    record["medications"] = [
+        {field: str(item.get(field) or NOT_AVAILABLE) for field in MEDICATION_FIELDS}
+        for item in medications
+    ]
+    return record, missing
@@ -1,28 +1,296 @@
-import requests
+import io
+import os
+import sys
+import time
+import wave
+import random
 import base64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+import numpy as np
+import httpx
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
+API_URL = "https://api.sarvam.ai/speech-to-text-translate"
+MODEL = os.getenv("SARVAM_STT_MODEL", "saaras:v1")
+# The REST endpoint only accepts short clips; longer audio is split below this length
+MAX_CHUNK_SECONDS = float(os.getenv("SARVAM_MAX_CHUNK_SECONDS", "25"))
+MIN_CHUNK_SECONDS = 5.0
+# A pause at least this long, this much quieter than speech, is a good place to cut
+MIN_SILENCE_SECONDS = 0.3
+SILENCE_RATIO = 0.1
+FRAME_SECONDS = 0.02
+CONCURRENCY = int(os.getenv("SARVAM_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = float(os.getenv("SARVAM_RPM", "60"))
+REQUEST_TIMEOUT = float(os.getenv("SARVAM_TIMEOUT", "60"))
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 1.0
+SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
 
-def speech_to_text_translate(base64_audio):
-    url = "https://api.sarvam.ai/speech-to-text-translate"
 
-    data = {
-        "model": "saaras:v1",
-    }
+class WavAudio:
+    """PCM WAV audio held as raw frames, sliceable into smaller WAV files"""
+
+    def __init__(self, wav_bytes):
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+            self.channels = wav.getnchannels()
+            self.sample_width = wav.getsampwidth()
+            self.rate = wav.getframerate()
+            self.frames = wav.readframes(wav.getnframes())
+        if self.sample_width not in SAMPLE_TYPES:
+            raise ValueError(f"Unsupported WAV sample width: {self.sample_width * 8} bits")
+        self.frame_count = len(self.frames) // (self.channels * self.sample_width)
+
+    @property
+    def duration(self):
+        return self.frame_count / self.rate
+
+    def samples(self):
+        """Mono float samples, for silence detection"""
+        data = np.frombuffer(self.frames, dtype=SAMPLE_TYPES[self.sample_width]).astype(np.float32)
+        if self.sample_width == 1:
+            data -= 128
+        return data.reshape(-1, self.channels).mean(axis=1)
+
+    def slice(self, start_frame, end_frame):
+        bytes_per_frame = self.channels * self.sample_width
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(self.sample_width)
+            wav.setframerate(self.rate)
+            wav.writeframes(self.frames[start_frame * bytes_per_frame:end_frame * bytes_per_frame])
+        return buffer.getvalue()
+
+
+def split_points(audio, max_seconds=MAX_CHUNK_SECONDS, min_seconds=MIN_CHUNK_SECONDS):
+    """Frame offsets at which to cut the audio into chunks of at most max_seconds.
+
+    Each cut goes in the middle of the last long enough pause before the
+    limit; with no such pause, at the quietest moment of the chunk's second
+    half; failing that, at the limit itself.
+    """
+    if audio.duration <= max_seconds:
+        return [0, audio.frame_count]
+    window = max(1, int(audio.rate * FRAME_SECONDS))
+    samples = audio.samples()
+    usable = len(samples) // window * window
+    energy = np.sqrt((samples[:usable].reshape(-1, window) ** 2).mean(axis=1))
+    if usable < len(samples):
+        energy = np.append(energy, np.sqrt((samples[usable:] ** 2).mean()))
+    silent = energy < SILENCE_RATIO * np.percentile(energy, 95)
+    min_silence = max(1, int(MIN_SILENCE_SECONDS / FRAME_SECONDS))
+    max_windows = int(max_seconds / FRAME_SECONDS)
+    min_windows = int(min(min_seconds, max_seconds / 2) / FRAME_SECONDS)
 
-    files = {
-        "file": ("input.wav", base64.b64decode(base64_audio), "audio/wav")
-    }
+    points = [0]
+    start = 0
+    while len(energy) - start > max_windows:
+        end = start + max_windows
+        cut = None
+        run_end = end
+        for index in range(end - 1, start + min_windows - 1, -1):
+            if silent[index]:
+                if run_end - index >= min_silence:
+                    cut = (index + run_end) // 2
+                    break
+            else:
+                run_end = index
+        if cut is None:
+            half = start + max_windows // 2
+            cut = half + int(np.argmin(energy[half:end]))
+            cut = cut if cut > start else end
+        points.append(cut)
+        start = cut
+    return [min(point * window, audio.frame_count) for point in points] + [audio.frame_count]
 
-    headers = {
-        'api-subscription-key': os.getenv('SARVAM_API_KEY')
-    }
 
+def retry_after_seconds(response):
+    """Delay requested by a Retry-After header (seconds or HTTP date), or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
     try:
-        response = requests.post(url, data=data, files=files, headers=headers)
-        return response.json()['transcript']
-    except requests.exceptions.RequestException as e:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Spaces request starts so no more than `per_minute` begin in any minute"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class SarvamClient:
+    """Async speech-to-text-translate client over one pooled HTTP connection set.
+
+    Use as `async with SarvamClient() as client:`; transcribe() accepts audio
+    of any length and may be called for several files at once, sharing the
+    concurrency and rate limits.
+    """
+
+    def __init__(self, api_key=None, concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE, timeout=REQUEST_TIMEOUT):
+        self.client = httpx.AsyncClient(
+            headers={"api-subscription-key": api_key or os.getenv("SARVAM_API_KEY")},
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(requests_per_minute)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def transcribe_chunk(self, wav_bytes):
+        """Response JSON for one API-sized WAV clip; retries rate limits, server errors and timeouts"""
+        async with self.semaphore:
+            for attempt in range(MAX_RETRIES):
+                await self.limiter.wait()
+                delay = None
+                try:
+                    response = await self.client.post(
+                        API_URL,
+                        data={"model": MODEL},
+                        files={"file": ("input.wav", wav_bytes, "audio/wav")},
+                    )
+                    if response.status_code != 429 and response.status_code < 500:
+                        response.raise_for_status()
+                        return response.json()
+                    error = httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+                    delay = retry_after_seconds(response)
+                except httpx.TransportError as e:
+                    error = e
+                print(f"Sarvam request attempt {attempt+1} failed: {str(error)}")
+                if attempt < MAX_RETRIES - 1:
+                    if delay is None:
+                        delay = BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+                    await asyncio.sleep(delay)
+            raise error
+
+    async def transcribe(self, wav_bytes):
+        """Transcript of a WAV clip of any length.
+
+        Returns {"transcript", "language_code", "segments", "audio_seconds",
+        "wall_seconds", "throughput"}; segments carry start/end times in
+        seconds so the stitched transcript can be traced back to the audio.
+        Audio that is not PCM WAV this module can read (24-bit, compressed
+        or other formats) is sent as a single upload, as before; its times
+        and throughput are then None.
+        """
+        start_time = time.time()
+        try:
+            audio = WavAudio(wav_bytes)
+        except (wave.Error, ValueError, EOFError) as e:
+            print(f"Cannot split this audio ({str(e)}); sending it in one request")
+            response = await self.transcribe_chunk(wav_bytes)
+            transcript = (response.get("transcript") or "").strip()
+            return {
+                "transcript": transcript,
+                "language_code": response.get("language_code"),
+                "segments": [{"start": None, "end": None, "transcript": transcript}],
+                "audio_seconds": None,
+                "wall_seconds": round(time.time() - start_time, 2),
+                "throughput": None,
+            }
+        points = split_points(audio)
+        bounds = list(zip(points, points[1:]))
+        responses = await asyncio.gather(*(self.transcribe_chunk(audio.slice(start, end)) for start, end in bounds))
+        segments = [
+            {
+                "start": round(start / audio.rate, 2),
+                "end": round(end / audio.rate, 2),
+                "transcript": (response.get("transcript") or "").strip(),
+            }
+            for (start, end), response in zip(bounds, responses)
+        ]
+        wall_seconds = time.time() - start_time
+        return {
+            "transcript": " ".join(segment["transcript"] for segment in segments if segment["transcript"]),
+            "language_code": next((response["language_code"] for response in responses if response.get("language_code")), None),
+            "segments": segments,
+            "audio_seconds": round(audio.duration, 2),
+            "wall_seconds": round(wall_seconds, 2),
+            "throughput": round(audio.duration / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+
+
+async def transcribe_files(paths, **client_options):
+    """Transcribe several WAV files concurrently with one client; returns results in input order"""
+    async with SarvamClient(**client_options) as client:
+        async def transcribe_path(path):
+            with open(path, "rb") as f:
+                return await client.transcribe(f.read())
+        return await asyncio.gather(*(transcribe_path(path) for path in paths))
+
+
+def speech_to_text_translate(base64_audio):
+    """Blocking wrapper around SarvamClient.transcribe; returns the transcript or {"error": ...}.
+
+    Async callers should use SarvamClient directly. When called from inside a
+    running event loop, the request runs on its own loop in a worker thread
+    (blocking the caller until it finishes).
+    """
+    async def run():
+        async with SarvamClient() as client:
+            return await client.transcribe(base64.b64decode(base64_audio))
+
+    try:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(run())['transcript']
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, run()).result()['transcript']
+    except (httpx.HTTPError, ValueError) as e:
         return {"error": str(e)}
+
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return f"{int(minutes):02d}:{seconds:05.2f}"
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:]
+    if not paths:
+        print("usage: python sarvamai.py recording.wav [more.wav ...]")
+        sys.exit(1)
+    start_time = time.time()
+    results = asyncio.run(transcribe_files(paths))
+    for path, result in zip(paths, results):
+        if result["audio_seconds"] is None:
+            print(f"\n{path} ({result['language_code']}, sent unsplit)\n{result['transcript']}")
+            continue
+        print(f"\n{path} ({result['language_code']}, {result['audio_seconds']}s audio, {result['throughput']}x realtime)")
+        for segment in result["segments"]:
+            print(f"[{format_timestamp(segment['start'])} - {format_timestamp(segment['end'])}] {segment['transcript']}")
+    audio_seconds = sum(result["audio_seconds"] or 0 for result in results)
+    wall_seconds = time.time() - start_time
+    print(f"\n{audio_seconds:.1f} audio-sec in {wall_seconds:.1f} wall-sec ({audio_seconds / wall_seconds:.2f} audio-sec/wall-sec)")
@@ -0,0 +1,94 @@
+"""Compare SmolDocling inference backends against the fp32 torch baseline.
+
+Runs every image in a fixture folder through each backend and reports
+tokens/sec, total time and how closely the DocTags and Markdown match the
+fp32 output on the raw images. With --preprocess every backend is also run
+on the cropped, deskewed and downscaled images the app sends:
+
+    python compare_backends.py fixtures/ --backends torch int8 onnx --preprocess --output backends.json
+"""
+import os
+import json
+import time
+import argparse
+import difflib
+from PIL import Image
+from dotenv import load_dotenv
+import docling_engine
+import preprocess
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def load_fixtures(folder):
+    names = sorted(name for name in os.listdir(folder) if name.lower().endswith(IMAGE_EXTENSIONS))
+    return [(name, Image.open(os.path.join(folder, name)).convert("RGB")) for name in names]
+
+
+def run_backend(backend, fixtures, prompt_text, max_new_tokens, hf_token=None, use_preprocess=False):
+    docling_model = docling_engine.get_docling_model(hf_token, backend)
+    tokens_before, seconds_before = docling_model.generated_tokens, docling_model.generate_seconds
+    outputs = {}
+    start_time = time.time()
+    for name, image in fixtures:
+        if use_preprocess:
+            image = preprocess.prepare(image, prompt_text).image
+        doctags = docling_engine.generate_doctags(docling_model, [image], prompt_text, max_new_tokens)[0]
+        outputs[name] = (doctags, docling_engine.doctags_to_markdown([doctags], [image]))
+    generate_seconds = docling_model.generate_seconds - seconds_before
+    return {
+        "backend": backend + ("+preprocess" if use_preprocess else ""),
+        "load_seconds": round(docling_model.load_seconds, 2),
+        "weights_mb": round(docling_model.parameter_mb, 1),
+        "seconds": round(time.time() - start_time, 2),
+        "tokens_per_second": round((docling_model.generated_tokens - tokens_before) / generate_seconds, 2)
+        if generate_seconds else 0.0,
+    }, outputs
+
+
+def similarity(baseline, outputs, field):
+    ratios = [difflib.SequenceMatcher(None, baseline[name][field], outputs[name][field]).ratio() for name in baseline]
+    return round(sum(ratios) / len(ratios), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixtures", help="folder of page images")
+    parser.add_argument("--backends", nargs="+", choices=docling_engine.BACKENDS, default=list(docling_engine.BACKENDS))
+    parser.add_argument("--prompt", default="Convert this page to docling.")
+    parser.add_argument("--max-new-tokens", type=int, default=docling_engine.MAX_NEW_TOKENS)
+    parser.add_argument("--preprocess", action="store_true", help="also run every backend on pre-processed images")
+    parser.add_argument("--output", default="backend_report.json")
+    args = parser.parse_args()
+
+    load_dotenv()
+    hf_token = os.getenv("HF_TOKEN")
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        raise SystemExit(f"No images found in {args.fixtures}")
+
+    baseline_stats, baseline = run_backend("torch", fixtures, args.prompt, args.max_new_tokens, hf_token)
+    report = [dict(baseline_stats, exact_match=1.0, similarity=1.0, markdown_similarity=1.0)]
+    variants = [(backend, False) for backend in args.backends if backend != "torch"]
+    if args.preprocess:
+        variants += [(backend, True) for backend in args.backends]
+    for backend, use_preprocess in variants:
+        stats, outputs = run_backend(backend, fixtures, args.prompt, args.max_new_tokens, hf_token, use_preprocess)
+        stats["exact_match"] = round(sum(baseline[name][0] == outputs[name][0] for name in baseline) / len(baseline), 3)
+        stats["similarity"] = similarity(baseline, outputs, 0)
+        # Cropping moves <loc_*> coordinates, so the Markdown is the fairer check for pre-processed runs.
+        stats["markdown_similarity"] = similarity(baseline, outputs, 1)
+        report.append(stats)
+
+    for stats in report:
+        print(
+            f"{stats['backend']:>17}: {stats['tokens_per_second']:7.2f} tok/s  {stats['seconds']:7.2f}s  "
+            f"exact {stats['exact_match']:.0%}  similarity {stats['similarity']:.3f}  "
+            f"markdown {stats['markdown_similarity']:.3f}"
+        )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"fixtures": [name for name, _ in fixtures], "prompt": args.prompt, "backends": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+import os
+import re
+import time
+import threading
+import resource
+import numpy as np
+import torch
+from PIL import Image
+from transformers import AutoProcessor, AutoModelForVision2Seq, TextIteratorStreamer
+from huggingface_hub import login
+from docling_core.types.doc import DoclingDocument
+from docling_core.types.doc.document import DocTagsDocument
+
+MODEL_ID = "ds4sd/SmolDocling-256M-preview"
+DEVICE = "cpu"  # Force CPU to avoid CUDA memory errors
+MAX_NEW_TOKENS = 800
+MAX_BATCH_SIZE = int(os.getenv("DOCLING_MAX_BATCH_SIZE", "8"))
+# Rough peak memory one page adds to a batch (image tiles, KV cache for 800 tokens)
+PAGE_MEMORY_MB = int(os.getenv("DOCLING_PAGE_MEMORY_MB", "400"))
+PDF_RENDER_SCALE = 2.0
+
+# Inference backend: "torch" (fp32), "int8" (dynamically quantised torch) or
+# "onnx" (ONNX Runtime graphs with a KV-cache decoder)
+DOCLING_BACKEND = os.getenv("DOCLING_BACKEND", "torch")
+# Suffix of the ONNX files to use from the model repo, e.g. "" (fp32) or "_quantized"
+DOCLING_ONNX_VARIANT = os.getenv("DOCLING_ONNX_VARIANT", "")
+BACKENDS = ("torch", "int8", "onnx")
+
+# Opening/closing tags in DocTags; <loc_*>, table cell and similar tags have no closing pair
+DOCTAG_PATTERN = re.compile(r"<(/?)([a-z_0-9]+)>")
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def resident_memory_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak RSS (KB on Linux, bytes on macOS).
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if peak > 1 << 30 else peak / 1024
+
+
+def _tensor_bytes(value):
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+class TorchBackend:
+    """transformers generate(), in fp32 or with Linear layers dynamically quantised to int8"""
+
+    def __init__(self, quantize=False):
+        self.name = "int8" if quantize else "torch"
+        model = AutoModelForVision2Seq.from_pretrained(
+            MODEL_ID,
+            torch_dtype=torch.float32,
+        ).to(DEVICE)
+        model.eval()
+        if quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+    @property
+    def weights_mb(self):
+        return sum(_tensor_bytes(value) for value in self.model.state_dict().values()) / (1024 * 1024)
+
+    def generate(self, inputs, max_new_tokens, streamer=None):
+        """Greedy decode; returns only the new token ids, one row per input"""
+        inputs = inputs.to(DEVICE)
+        with torch.no_grad():  # Disable gradient calculation to save memory
+            generated_ids = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=False,     # Deterministic generation
+                streamer=streamer
+            )
+        # Prompts are left-padded, so generated tokens start at the same offset for every row.
+        return generated_ids[:, inputs.input_ids.shape[1]:]
+
+
+class OnnxBackend:
+    """Greedy decoding over the vision encoder, token embedder and merged
+    KV-cache decoder graphs published in the model repo's onnx/ folder"""
+
+    def __init__(self, processor, variant=DOCLING_ONNX_VARIANT):
+        import onnxruntime
+        from huggingface_hub import hf_hub_download
+        from transformers import AutoConfig
+
+        self.name = "onnx"
+        config = AutoConfig.from_pretrained(MODEL_ID)
+        text_config = config.text_config
+        self.num_layers = text_config.num_hidden_layers
+        self.num_kv_heads = text_config.num_key_value_heads
+        self.head_dim = getattr(text_config, "head_dim", None) or text_config.hidden_size // text_config.num_attention_heads
+        self.image_token_id = config.image_token_id
+        self.eos_token_id = processor.tokenizer.convert_tokens_to_ids("<end_of_utterance>")
+        self.pad_token_id = processor.tokenizer.pad_token_id or self.eos_token_id
+
+        self.paths = {
+            name: hf_hub_download(MODEL_ID, f"onnx/{name}{variant}.onnx")
+            for name in ("vision_encoder", "embed_tokens", "decoder_model_merged")
+        }
+        providers = ["CPUExecutionProvider"]
+        self.vision = onnxruntime.InferenceSession(self.paths["vision_encoder"], providers=providers)
+        self.embed = onnxruntime.InferenceSession(self.paths["embed_tokens"], providers=providers)
+        self.decoder = onnxruntime.InferenceSession(self.paths["decoder_model_merged"], providers=providers)
+
+    @property
+    def weights_mb(self):
+        return sum(os.path.getsize(path) for path in self.paths.values()) / (1024 * 1024)
+
+    def generate(self, inputs, max_new_tokens, streamer=None):
+        """Greedy decode with the decoder's KV cache; returns only the new token ids.
+
+        A streamer (single-row batches only) receives the prompt and then each
+        new token, the same calls transformers' generate() makes.
+        """
+        input_ids = inputs["input_ids"].numpy()
+        attention_mask = inputs["attention_mask"].numpy().astype(np.int64)
+        batch_size = input_ids.shape[0]
+        position_ids = np.cumsum(attention_mask, axis=-1) - 1
+        position_ids[attention_mask == 0] = 1
+        past_key_values = {
+            f"past_key_values.{layer}.{kv}": np.zeros([batch_size, self.num_kv_heads, 0, self.head_dim], dtype=np.float32)
+            for layer in range(self.num_layers)
+            for kv in ("key", "value")
+        }
+
+        inputs_embeds = self.embed.run(None, {"input_ids": input_ids})[0]
+        image_features = self.vision.run(
+            ["image_features"],
+            {
+                "pixel_values": inputs["pixel_values"].numpy(),
+                "pixel_attention_mask": inputs["pixel_attention_mask"].numpy().astype(np.bool_),
+            },
+        )[0]
+        inputs_embeds[input_ids == self.image_token_id] = image_features.reshape(-1, image_features.shape[-1])
+
+        if streamer is not None:
+            streamer.put(inputs["input_ids"])
+        finished = np.zeros(batch_size, dtype=bool)
+        generated = []
+        for _ in range(max_new_tokens):
+            logits, *present_key_values = self.decoder.run(
+                None,
+                dict(inputs_embeds=inputs_embeds, attention_mask=attention_mask, position_ids=position_ids, **past_key_values),
+            )
+            next_tokens = logits[:, -1].argmax(-1)
+            next_tokens = np.where(finished, self.pad_token_id, next_tokens)
+            generated.append(next_tokens)
+            if streamer is not None:
+                streamer.put(torch.from_numpy(next_tokens.astype(np.int64)))
+            finished |= next_tokens == self.eos_token_id
+            if finished.all():
+                break
+
+            for key, value in zip(past_key_values, present_key_values):
+                past_key_values[key] = value
+            next_ids = next_tokens[:, None].astype(np.int64)
+            inputs_embeds = self.embed.run(None, {"input_ids": next_ids})[0]
+            attention_mask = np.concatenate([attention_mask, np.ones_like(next_ids)], axis=-1)
+            position_ids = position_ids[:, -1:] + 1
+        if streamer is not None:
+            streamer.end()
+        return np.stack(generated, axis=1) if generated else np.zeros((batch_size, 0), dtype=np.int64)
+
+
+class DoclingModel:
+    """Processor and inference backend loaded once per process, with load and speed statistics"""
+
+    def __init__(self, processor, backend, load_seconds, memory_mb):
+        self.processor = processor
+        self.backend = backend
+        self.load_seconds = load_seconds
+        self.memory_mb = memory_mb
+        self.warmed_up = False
+        self.generated_tokens = 0
+        self.generate_seconds = 0.0
+
+    @property
+    def parameter_mb(self):
+        return self.backend.weights_mb
+
+    @property
+    def tokens_per_second(self):
+        return self.generated_tokens / self.generate_seconds if self.generate_seconds else 0.0
+
+
+def get_docling_model(hf_token=None, backend=None):
+    """Return the process-wide SmolDocling model for a backend, loading it on first use.
+
+    The registry lives at module level, so it survives Streamlit reruns and is
+    shared by every session served by the process.
+    """
+    backend = backend or DOCLING_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown DOCLING_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}")
+    with _registry_lock:
+        if backend not in _registry:
+            if hf_token:
+                login(token=hf_token)
+            rss_before = resident_memory_mb()
+            start_time = time.time()
+            processor = AutoProcessor.from_pretrained(MODEL_ID)
+            # Batched generation needs prompts padded on the left.
+            processor.tokenizer.padding_side = "left"
+            if backend == "onnx":
+                engine = OnnxBackend(processor)
+            else:
+                engine = TorchBackend(quantize=backend == "int8")
+            _registry[backend] = DoclingModel(
+                processor, engine, time.time() - start_time, resident_memory_mb() - rss_before
+            )
+        return _registry[backend]
+
+
+def is_loaded(backend=None):
+    return (backend or DOCLING_BACKEND) in _registry
+
+
+def warm_up(hf_token=None, backend=None):
+    """Load the model and run one tiny generation so the first real page is not slowed down"""
+    docling_model = get_docling_model(hf_token, backend)
+    if not docling_model.warmed_up:
+        convert_image(docling_model, Image.new("RGB", (64, 64), "white"), max_new_tokens=1)
+        docling_model.warmed_up = True
+    return docling_model
+
+
+def build_inputs(processor, images, prompt_text):
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "image"},
+                {"type": "text", "text": prompt_text}
+            ]
+        },
+    ]
+    prompt = processor.apply_chat_template(messages, add_generation_prompt=True)
+    return processor(
+        text=[prompt] * len(images), images=[[image] for image in images], padding=True, return_tensors="pt"
+    )
+
+
+def doctags_to_markdown(doctags_pages, images):
+    """Assemble per-page DocTags into one DoclingDocument and export it as Markdown"""
+    doctags_doc = DocTagsDocument.from_doctags_and_image_pairs(doctags_pages, images)
+    doc = DoclingDocument(name="Document")
+    doc.load_from_doctags(doctags_doc)
+    return doc.export_to_markdown()
+
+
+def available_memory_mb():
+    """Memory available for new allocations, from /proc/meminfo when present"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def pick_batch_size(page_count):
+    """Largest batch that fits in about half of the available RAM, capped at MAX_BATCH_SIZE"""
+    available = available_memory_mb()
+    if available is None:
+        return 1
+    return max(1, min(page_count, MAX_BATCH_SIZE, int(available * 0.5 // PAGE_MEMORY_MB)))
+
+
+def render_pdf(pdf, scale=PDF_RENDER_SCALE):
+    """Render every page of a PDF (path or bytes) to an RGB image"""
+    import pypdfium2 as pdfium
+
+    document = pdfium.PdfDocument(pdf)
+    try:
+        return [page.render(scale=scale).to_pil().convert("RGB") for page in document]
+    finally:
+        document.close()
+
+
+def clean_doctags(doctags, pad_token=None):
+    # Rows that finish early in a batch are padded on the right.
+    doctags = doctags.replace("<end_of_utterance>", "")
+    if pad_token:
+        doctags = doctags.replace(pad_token, "")
+    return doctags.strip()
+
+
+def _record_generation(docling_model, trimmed_generated_ids, seconds):
+    docling_model.generate_seconds += seconds
+    pad_token_id = docling_model.processor.tokenizer.pad_token_id
+    if pad_token_id is None:
+        docling_model.generated_tokens += trimmed_generated_ids.shape[0] * trimmed_generated_ids.shape[1]
+    else:
+        docling_model.generated_tokens += int((trimmed_generated_ids != pad_token_id).sum())
+
+
+def generate_doctags(docling_model, images, prompt_text, max_new_tokens=MAX_NEW_TOKENS):
+    """One padded generate() call for a batch of pages; returns DocTags per page"""
+    processor = docling_model.processor
+    inputs = build_inputs(processor, images, prompt_text)
+
+    start_time = time.time()
+    trimmed_generated_ids = docling_model.backend.generate(inputs, max_new_tokens)
+    _record_generation(docling_model, trimmed_generated_ids, time.time() - start_time)
+
+    return [
+        clean_doctags(doctags, processor.tokenizer.pad_token)
+        for doctags in processor.batch_decode(trimmed_generated_ids, skip_special_tokens=False)
+    ]
+
+
+def convert_pages(docling_model, pages, prompt_text="Convert this page to docling.",
+                  max_new_tokens=MAX_NEW_TOKENS, batch_size=None):
+    """Convert a list of page images (or a PDF path/bytes) into one document.
+
+    Pages are grouped into batches sized to the available RAM, with one
+    generate() per batch. Returns (per-page DocTags, markdown).
+    """
+    if isinstance(pages, (str, bytes)):
+        pages = render_pdf(pages)
+    batch_size = batch_size or pick_batch_size(len(pages))
+    doctags_pages = []
+    for start in range(0, len(pages), batch_size):
+        doctags_pages.extend(generate_doctags(docling_model, pages[start:start + batch_size], prompt_text, max_new_tokens))
+    return doctags_pages, doctags_to_markdown(doctags_pages, pages)
+
+
+def convert_image(docling_model, image, prompt_text="Convert this page to docling.", max_new_tokens=MAX_NEW_TOKENS):
+    """Run SmolDocling on one image; returns (doctags, markdown)"""
+    doctags_pages, markdown = convert_pages(docling_model, [image], prompt_text, max_new_tokens, batch_size=1)
+    return doctags_pages[0], markdown
+
+
+def stream_doctags(docling_model, image, prompt_text="Convert this page to docling.", max_new_tokens=MAX_NEW_TOKENS):
+    """Decode one page on a background thread, yielding the DocTags generated so far
+    after every decoded chunk of text"""
+    processor = docling_model.processor
+    inputs = build_inputs(processor, [image], prompt_text)
+    streamer = TextIteratorStreamer(processor.tokenizer, skip_prompt=True, skip_special_tokens=False)
+    result = {}
+
+    def run():
+        start_time = time.time()
+        try:
+            result["ids"] = docling_model.backend.generate(inputs, max_new_tokens, streamer=streamer)
+            _record_generation(docling_model, result["ids"], time.time() - start_time)
+        except Exception as e:
+            result["error"] = e
+            streamer.end()
+
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+    doctags = ""
+    for text in streamer:
+        doctags += text
+        yield clean_doctags(doctags, processor.tokenizer.pad_token)
+    worker.join()
+    if "error" in result:
+        raise result["error"]
+
+
+def complete_elements_end(doctags):
+    """Offset just past the last top-level DocTags element that has been closed.
+
+    Elements are the direct children of <doctag>; an element is complete once
+    its closing tag has balanced every opening tag of the same name.
+    """
+    position = doctags.find("<doctag>")
+    position = 0 if position < 0 else position + len("<doctag>")
+    complete = position
+    while True:
+        match = DOCTAG_PATTERN.match(doctags, len(doctags) - len(doctags[position:].lstrip()))
+        if not match or match.group(1) or match.group(2) == "doctag":
+            return complete
+        name = match.group(2)
+        if name == "page_break":
+            position = complete = match.end()
+            continue
+        depth = 0
+        for tag in re.finditer(rf"<(/?){name}>", doctags[match.start():]):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                position = complete = match.start() + tag.end()
+                break
+        else:
+            return complete
+
+
+def stream_page(docling_model, image, prompt_text="Convert this page to docling.", max_new_tokens=MAX_NEW_TOKENS):
+    """Stream one page as (doctags so far, markdown of the complete elements so far).
+
+    Markdown is re-rendered only when another element closes, so the first
+    heading or paragraph shows up long before the page finishes decoding. The
+    last item always carries the full DocTags and their final Markdown.
+    """
+    rendered_end = 0
+    markdown = ""
+    doctags = ""
+    for doctags in stream_doctags(docling_model, image, prompt_text, max_new_tokens):
+        end = complete_elements_end(doctags)
+        if end > rendered_end:
+            rendered_end = end
+            partial = doctags[:end]
+            if not partial.lstrip().startswith("<doctag>"):
+                partial = "<doctag>" + partial
+            markdown = doctags_to_markdown([partial + "</doctag>"], [image])
+        yield doctags, markdown
+    yield doctags, doctags_to_markdown([doctags], [image])
@@ -2,14 +2,13 @@ import streamlit as st
 from PIL import Image
 import os
 import time
-import torch
-from io import BytesIO
 import base64
-import asyncio
-from pathlib import Path
 from dotenv import load_dotenv
-from googletrans import Translator
-from gtts import gTTS
+import result_cache
+import translation_engine
+import tts_engine
+import preprocess
+from pipeline import Pipeline
 
 # Try to import optional dependencies
 try:
@@ -28,10 +27,7 @@ except ImportError:
     langchain_available = False
 
 try:
-    from transformers import AutoProcessor, AutoModelForVision2Seq
-    from huggingface_hub import login
-    from docling_core.types.doc import DoclingDocument
-    from docling_core.types.doc.document import DocTagsDocument
+    import docling_engine
     docling_available = True
 except ImportError:
     docling_available = False
@@ -40,6 +36,13 @@ except ImportError:
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 HF_TOKEN = os.getenv("HF_TOKEN")
+# Load (and exercise) SmolDocling at startup instead of on the first upload
+DOCLING_WARMUP = os.getenv("DOCLING_WARMUP", "").lower() in ("1", "true", "yes")
+# Render single pages progressively while SmolDocling is still decoding
+DOCLING_STREAM = os.getenv("DOCLING_STREAM", "1").lower() in ("1", "true", "yes")
+
+ANALYSIS_MODEL = "gemini-1.5-flash"
+DEFAULT_QUESTION = "What is shown in this image?"
 
 # Initialize session state
 if 'chat_history' not in st.session_state:
@@ -55,9 +58,6 @@ if 'camera_has_processed' not in st.session_state:
     st.session_state.camera_has_processed = False
 if 'camera_image_hash' not in st.session_state:
     st.session_state.camera_image_hash = None
-# Add translation cache to avoid repeated translations
-if 'translation_cache' not in st.session_state:
-    st.session_state.translation_cache = {}
 
 def check_dependencies():
     """Check for missing dependencies"""
@@ -97,145 +97,84 @@ def initialize_chat():
         st.error(f"Error initializing chat: {str(e)}")
         return None
 
-def process_image_docling(image, prompt_text="Convert this page to docling."):
-    """Process image using SmolDocling"""
-    if not docling_available:
-        st.error("SmolDocling dependencies are not installed")
-        return None, None, None
-        
+def get_docling_model():
+    """Load SmolDocling once per process, reporting load errors in the UI"""
     if not HF_TOKEN:
         st.warning("HF_TOKEN not found in .env file. Authentication may fail.")
+    try:
+        return docling_engine.get_docling_model(HF_TOKEN)
+    except Exception as e:
+        st.error(f"Error loading SmolDocling model: {str(e)}")
+        return None
+
+def convert_pages_cached(docling_model, pages, prompt_text, on_partial=None):
+    """Run SmolDocling through the result cache; returns (per-page DocTags, markdown).
+
+    With on_partial, a single page is streamed and on_partial(markdown) is
+    called each time another element of the page has been decoded.
+    """
+    page_hashes = [result_cache.content_hash(page) for page in pages]
+    cache_key = result_cache.image_key(*pages, content_hashes=page_hashes)
+    cache_task = f"docling:{docling_model.backend.name}"
+    cached = result_cache.get_result_cache().get(cache_key, cache_task, prompt_text)
+    if cached:
+        return cached["doctags"], cached["markdown"]
+    # Cropped, deskewed and capped at the resolution the task needs
+    pages = [preprocess.prepare(page, prompt_text, page_hash).image for page, page_hash in zip(pages, page_hashes)]
+    if on_partial is not None and DOCLING_STREAM and len(pages) == 1:
+        doctags, md_content = "", ""
+        for doctags, md_content in docling_engine.stream_page(docling_model, pages[0], prompt_text):
+            if md_content:
+                on_partial(md_content)
+        doctags_pages = [doctags]
     else:
-        try:
-            login(token=HF_TOKEN)
-        except Exception as e:
-            st.error(f"Hugging Face login error: {str(e)}")
-            return None, None, None
+        doctags_pages, md_content = docling_engine.convert_pages(docling_model, pages, prompt_text)
+    result_cache.get_result_cache().put(cache_key, cache_task, prompt_text, {"doctags": doctags_pages, "markdown": md_content})
+    return doctags_pages, md_content
+
+def describe_image(image, question="What is shown in this image?"):
+    """Ask Gemini about an image through the result cache; raises on API errors"""
+    cache_key = result_cache.image_key(image)
+    cached = result_cache.get_result_cache().get(cache_key, ANALYSIS_MODEL, question, near_duplicates=True)
+    if cached:
+        return cached["analysis"]
     
-    # Check for CUDA and use CPU if not available
-    device = "cpu"  # Force CPU to avoid CUDA memory errors
+    model = ChatGoogleGenerativeAI(
+        model=ANALYSIS_MODEL,
+        google_api_key=GOOGLE_API_KEY,
+        transport="rest",
+        temperature=0.2,
+        max_output_tokens=800
+    )
     
-    try:
-        start_time = time.time()
-        
-        # Load processor and model with error handling
-        try:
-            processor = AutoProcessor.from_pretrained("ds4sd/SmolDocling-256M-preview")
-            model = AutoModelForVision2Seq.from_pretrained(
-                "ds4sd/SmolDocling-256M-preview",
-                torch_dtype=torch.float32,
-            ).to(device)
-        except Exception as e:
-            st.error(f"Error loading SmolDocling model: {str(e)}")
-            return None, None, None
-        
-        # Create input messages
-        messages = [
+    # Downscaled copy with a cached JPEG encoding; the caller's image is left untouched
+    img_base64 = base64.b64encode(preprocess.prepare(image, preprocess.DESCRIBE_TASK, cache_key[1]).jpeg_bytes()).decode()
+    
+    message = {
+        "role": "user",
+        "content": [
             {
-                "role": "user",
-                "content": [
-                    {"type": "image"},
-                    {"type": "text", "text": prompt_text}
-                ]
+                "type": "text",
+                "text": f"{question} Please provide a concise description (under 200 words)."
             },
-        ]
-        
-        # Prepare inputs
-        prompt = processor.apply_chat_template(messages, add_generation_prompt=True)
-        inputs = processor(text=prompt, images=[image], return_tensors="pt")
-        inputs = inputs.to(device)
-        
-        # Generate outputs with optimized settings
-        with torch.no_grad():  # Disable gradient calculation to save memory
-            generated_ids = model.generate(
-                **inputs, 
-                max_new_tokens=800,  # Reduced for stability
-                do_sample=False      # Deterministic generation
-            )
-        
-        prompt_length = inputs.input_ids.shape[1]
-        trimmed_generated_ids = generated_ids[:, prompt_length:]
-        doctags = processor.batch_decode(
-            trimmed_generated_ids,
-            skip_special_tokens=False,
-        )[0].lstrip()
-        
-        # Clean the output
-        doctags = doctags.replace("<end_of_utterance>", "").strip()
-        
-        # Populate document
-        doctags_doc = DocTagsDocument.from_doctags_and_image_pairs([doctags], [image])
-        
-        # Create a docling document
-        doc = DoclingDocument(name="Document")
-        doc.load_from_doctags(doctags_doc)
-        
-        # Export as markdown
-        md_content = doc.export_to_markdown()
-        
-        processing_time = time.time() - start_time
-        
-        return doctags, md_content, processing_time
-    except Exception as e:
-        st.error(f"Error in SmolDocling processing: {str(e)}")
-        import traceback
-        st.error(traceback.format_exc())
-        return None, None, None
-
-def analyze_image_content(image, question="What is shown in this image?"):
-    """Analyze image content using Gemini if available"""
-    if not langchain_available or not GOOGLE_API_KEY:
-        st.warning("Image analysis requires langchain and Google API key")
-        return None
-        
-    try:
-        model = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
-            google_api_key=GOOGLE_API_KEY,
-            transport="rest",
-            temperature=0.2,
-            max_output_tokens=800
-        )
-        
-        # Convert and resize image
-        max_size = (800, 800)  # Reduced size for stability
-        if image.width > max_size[0] or image.height > max_size[1]:
-            image.thumbnail(max_size, Image.LANCZOS)
-        
-        buffered = BytesIO()
-        image.save(buffered, format="JPEG", quality=85)
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
-        
-        message = {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text",
-                    "text": f"{question} Please provide a concise description (under 200 words)."
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{img_base64}"
-                    }
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/jpeg;base64,{img_base64}"
                 }
-            ]
-        }
-        
-        response = model.invoke(input=[message])
-        
-        # Clean up response
-        import re
-        cleaned_text = re.sub(r'\n+', '\n', response.content)
-        cleaned_text = re.sub(r'\s+\.', '.', cleaned_text)
-        
-        return cleaned_text
-        
-    except Exception as e:
-        st.error(f"Error analyzing image: {str(e)}")
-        import traceback
-        st.error(traceback.format_exc())
-        return None
+            }
+        ]
+    }
+    
+    response = model.invoke(input=[message])
+    
+    # Clean up response
+    import re
+    cleaned_text = re.sub(r'\n+', '\n', response.content)
+    cleaned_text = re.sub(r'\s+\.', '.', cleaned_text)
+    
+    result_cache.get_result_cache().put(cache_key, ANALYSIS_MODEL, question, {"analysis": cleaned_text})
+    return cleaned_text
 
 def get_language_menu():
     """Return dictionary of supported languages"""
@@ -260,70 +199,192 @@ def get_language_menu():
     }
 
 def translate_text(text, target_language_code):
-    """Translate text with improved error handling"""
+    """Translate text sentence-chunk by chunk, concurrently, through the shared translation cache"""
     if not text or text.strip() == "" or target_language_code == 'en':
         return text
 
     try:
-        translator = Translator()
-        chunks = [text[i:i+300] for i in range(0, len(text), 300)]
-        translated_chunks = []
-
-        for i, chunk in enumerate(chunks):
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    if attempt > 0:
-                        time.sleep(2)
-
-                    print(f"Attempt {attempt+1}: Translating chunk {i+1}/{len(chunks)}")
-                    
-                    translation = translator.translate(chunk, dest=target_language_code, src='en')
-                    print(f"Translation type: {type(translation)}")  # Debugging
-                    
-                    # If `translation` is a coroutine, wait for result
-                    if asyncio.iscoroutine(translation):
-                        translation = asyncio.run(translation)
-                        print(f"Coroutine awaited. New Type: {type(translation)}")  # Debugging
-
-                    if hasattr(translation, 'text'):
-                        translated_chunks.append(translation.text)
-                        break
-                    else:
-                        print("Translation failed: No `.text` attribute")
-                        time.sleep(1)
-
-                except Exception as chunk_error:
-                    print(f"Translation error on attempt {attempt+1}: {str(chunk_error)}")
-                    time.sleep(1.5)
-
-        return ' '.join(translated_chunks) if translated_chunks else text
-
+        return translation_engine.translate(text, target_language_code, src='en')
     except Exception as e:
         print(f"Translation error: {str(e)}")
         return text
 
 
-def generate_audio(text, language_code='en'):
-    """Generate audio from text"""
+def play_audio(text, language_code, file_name, title=None):
+    """Show a player as soon as the first sentence is synthesised, then swap in
+    the full recording and a download button once every sentence is ready"""
+    if not text or text.strip() == "":
+        return None
+    
+    placeholder = st.empty()
+    audio_data = b""
+    segments = 0
     try:
-        if not text or text.strip() == "":
-            return None
-            
-        audio_bytes_io = BytesIO()
-        tts = gTTS(text=text[:3000], lang=language_code, slow=False)  # Limit text length
-        tts.write_to_fp(audio_bytes_io)
-        audio_bytes_io.seek(0)
-        return audio_bytes_io.getvalue()
+        for segment in tts_engine.iter_audio(text, language_code):
+            audio_data += segment
+            segments += 1
+            if segments == 1:
+                with placeholder.container():
+                    if title:
+                        st.markdown(title)
+                    st.audio(audio_data, format='audio/mp3')
+                    st.caption("Synthesising the rest of the text...")
     except Exception as e:
         st.error(f"Audio generation error: {str(e)}")
         return None
+    
+    if not audio_data:
+        placeholder.empty()
+        return None
+    with placeholder.container():
+        if title:
+            st.markdown(title)
+        st.audio(audio_data, format='audio/mp3')
+        st.download_button(
+            label="💾 Download Audio",
+            data=audio_data,
+            file_name=file_name,
+            mime="audio/mp3"
+        )
+    return audio_data
+
+def run_pipeline(image, pages=None, prompt_text=None, question=None, language_code='en',
+                 speak=False, translation_title="### 🌐 Translation:"):
+    """Run SmolDocling, Gemini analysis, translation and speech as one pipeline.
 
-def generate_image_hash(img):
-    """Generate a simple hash for an image to detect changes"""
-    buffered = BytesIO()
-    img.save(buffered, format="JPEG", quality=50)
-    return hash(buffered.getvalue())
+    SmolDocling (when pages are given) and Gemini (when a question is given)
+    run side by side. The main text, the SmolDocling Markdown or else the
+    analysis, is split into chunks as soon as it is ready, and every chunk is
+    translated and then (with speak=True) synthesised on its own. Output is
+    rendered as it arrives. Returns the texts, audio and per-stage timings.
+    """
+    docling_model = get_docling_model() if pages and docling_available else None
+    if pages and docling_model is None:
+        if not docling_available:
+            st.error("SmolDocling dependencies are not installed")
+        pages = None
+    
+    pipeline = Pipeline()
+    translate = language_code != 'en'
+    results = {"doctags": None, "markdown": None, "analysis": None, "translation": None, "audio": None}
+    chunks = []
+    translated = {}
+    audio = {}
+    
+    def fan_out(text):
+        text_chunks = translation_engine.split_chunks(text)
+        pipeline.emit("chunks", text_chunks)
+        for index, (chunk, _) in enumerate(text_chunks):
+            if translate:
+                pipeline.submit("translation", translate_chunk, index, chunk)
+            elif speak:
+                pipeline.submit("audio", speak_chunk, index, chunk)
+    
+    def translate_chunk(index, chunk):
+        translation = translation_engine.translate(chunk, language_code)
+        if speak:
+            pipeline.submit("audio", speak_chunk, index, translation)
+        return index, translation
+    
+    def speak_chunk(index, chunk):
+        return index, tts_engine.synthesize(chunk, language_code)
+    
+    def docling_stage():
+        doctags_pages, md_content = convert_pages_cached(
+            docling_model, pages, prompt_text, on_partial=lambda md: pipeline.emit("docling", md)
+        )
+        fan_out(md_content)
+        return doctags_pages, md_content
+    
+    def analysis_stage():
+        analysis = describe_image(image, question)
+        if not pages:
+            fan_out(analysis)
+        return analysis
+    
+    if pages:
+        st.markdown("### 📄 SmolDocling Results:")
+        docling_box = st.empty()
+        pipeline.submit("docling", docling_stage)
+    if question:
+        st.markdown("### 🔍 Analysis (English):")
+        analysis_box = st.empty()
+        pipeline.submit("analysis", analysis_stage)
+    if translate:
+        st.markdown(translation_title)
+        translation_box = st.empty()
+    audio_box = st.empty()
+    
+    def ready_prefix(done):
+        """Indices 0..n-1 that are all finished, so output stays in reading order"""
+        count = 0
+        while count in done:
+            count += 1
+        return count
+    
+    first_element_seconds = None
+    audio_shown = False
+    with st.spinner("Processing..."):
+        for kind, stage, payload in pipeline.events():
+            if kind == "error":
+                st.error(f"Error in {stage} stage: {str(payload)}")
+            elif stage == "docling" and kind == "partial":
+                if first_element_seconds is None:
+                    first_element_seconds = time.time() - pipeline.started
+                docling_box.markdown(payload + " ▌")
+            elif stage == "docling":
+                results["doctags"] = "\n".join(payload[0])
+                results["markdown"] = payload[1]
+                docling_box.markdown(payload[1])
+            elif stage == "analysis":
+                results["analysis"] = payload
+                analysis_box.write(payload)
+            elif stage == "chunks":
+                chunks = payload
+            elif stage == "translation":
+                translated[payload[0]] = payload[1]
+                ready = ready_prefix(translated)
+                if ready:
+                    translation_box.markdown(translation_engine.join_chunks(
+                        [(translated[index], separator) for index, (_, separator) in enumerate(chunks[:ready])]
+                    ) + (" ▌" if ready < len(chunks) else ""))
+            elif stage == "audio":
+                audio[payload[0]] = payload[1]
+                # Chunks finish in any order; show the opening audio as soon as it is ready.
+                if not audio_shown and 0 in audio:
+                    audio_shown = True
+                    with audio_box.container():
+                        st.markdown("### 🔊 Text-to-Speech")
+                        st.audio(audio[0], format='audio/mp3')
+    
+    if translate and chunks:
+        # A chunk whose stage failed is shown untranslated.
+        results["translation"] = translation_engine.join_chunks(
+            [(translated.get(index, chunk), separator) for index, (chunk, separator) in enumerate(chunks)]
+        )
+        translation_box.markdown(results["translation"])
+    if speak and audio:
+        results["audio"] = b"".join(audio[index] for index in sorted(audio))
+        with audio_box.container():
+            st.markdown("### 🔊 Text-to-Speech")
+            st.audio(results["audio"], format='audio/mp3')
+            st.download_button(
+                label="💾 Download Audio",
+                data=results["audio"],
+                file_name=f"analysis_{language_code}.mp3",
+                mime="audio/mp3"
+            )
+    
+    results["timings"] = pipeline.timing_summary()
+    results["seconds"] = time.time() - pipeline.started
+    print(f"Pipeline timings: {results['timings']}")
+    st.caption(" · ".join(
+        [f"{stage} {timing['busy_seconds']:.1f}s" + (f" ×{timing['calls']}" if timing['calls'] > 1 else "")
+         for stage, timing in results["timings"].items()]
+        + ([f"first element {first_element_seconds:.1f}s"] if first_element_seconds is not None else [])
+        + [f"total {results['seconds']:.1f}s"]
+    ))
+    return results
 
 def main():
     st.set_page_config(page_title="SmolDocling OCR App", layout="wide")
@@ -342,10 +403,33 @@ def main():
         if st.session_state.chain is None:
             st.error("Failed to initialize chat. Check your Google API key.")
     
+    if docling_available and DOCLING_WARMUP and not docling_engine.is_loaded():
+        with st.spinner("Warming up SmolDocling..."):
+            try:
+                docling_engine.warm_up(HF_TOKEN)
+            except Exception as e:
+                st.error(f"SmolDocling warm-up failed: {str(e)}")
+    
     # Sidebar
     with st.sidebar:
         st.header("⚙️ Settings")
         
+        if docling_available and docling_engine.is_loaded():
+            docling_model = docling_engine.get_docling_model()
+            st.caption(
+                f"SmolDocling ({docling_model.backend.name}) loaded in {docling_model.load_seconds:.1f}s · "
+                f"{docling_model.parameter_mb:.0f} MB weights · "
+                f"+{docling_model.memory_mb:.0f} MB RSS (process {docling_engine.resident_memory_mb():.0f} MB)"
+            )
+            if docling_model.generated_tokens:
+                st.caption(f"Decoding at {docling_model.tokens_per_second:.1f} tokens/s")
+        
+        cache_stats = result_cache.get_result_cache().stats()
+        st.caption(
+            f"Result cache: {cache_stats['entries']} entries · {cache_stats['mb']:.1f} MB · "
+            f"{cache_stats['hits']} hits / {cache_stats['misses']} misses"
+        )
+        
         # SmolDocling task selection
         task_type = st.selectbox(
             "Select task type",
@@ -395,7 +479,7 @@ def main():
                 image = Image.open(camera_image).convert("RGB")  # Ensure RGB mode
                 
                 # Check if this is a new image or we've already processed it
-                current_image_hash = generate_image_hash(image)
+                current_image_hash = result_cache.content_hash(image)
                 is_new_image = (st.session_state.camera_image_hash != current_image_hash)
                 
                 col1, col2 = st.columns(2)
@@ -413,51 +497,24 @@ def main():
                     if st.button("Analyze Image"):
                         # Only run the analysis if it's a new image or hasn't been processed
                         if is_new_image or not st.session_state.camera_has_processed:
-                            with st.spinner("Analyzing image..."):
-                                analysis = analyze_image_content(image, question)
-                                if analysis:
+                            if not langchain_available or not GOOGLE_API_KEY:
+                                st.warning("Image analysis requires langchain and Google API key")
+                            else:
+                                # Analysis, then translation and speech per chunk as each piece is ready
+                                results = run_pipeline(
+                                    image,
+                                    question=question,
+                                    language_code=languages[selected_language],
+                                    speak=True,
+                                    translation_title=f"### 🌐 Analysis in {selected_language}:"
+                                )
+                                if results["analysis"]:
                                     # Update session state
                                     st.session_state.camera_image_hash = current_image_hash
                                     st.session_state.camera_has_processed = True
-                                    st.session_state.extracted_text = analysis
-                                    
-                                    st.markdown("### 🔍 Analysis (English):")
-                                    st.write(analysis)
-                                    
-                                    # Always translate when a non-English language is selected
-                                    if selected_language != "English":
-                                        with st.spinner(f"Translating to {selected_language}..."):
-                                            translated_analysis = translate_text(analysis, languages[selected_language])
-                                            if translated_analysis:
-                                                st.session_state.translated_text = translated_analysis
-                                                st.markdown(f"### 🌐 Analysis in {selected_language}:")
-                                                st.write(translated_analysis)
-                                                
-                                                # Generate audio with translated text
-                                                audio_data = generate_audio(translated_analysis, languages[selected_language])
-                                                if audio_data:
-                                                    st.markdown("### 🔊 Text-to-Speech")
-                                                    st.audio(audio_data, format='audio/mp3')
-                                                    
-                                                    st.download_button(
-                                                        label="💾 Download Audio",
-                                                        data=audio_data,
-                                                        file_name=f"analysis_{selected_language}.mp3",
-                                                        mime="audio/mp3"
-                                                    )
-                                    else:
-                                        # English audio
-                                        audio_data = generate_audio(analysis, 'en')
-                                        if audio_data:
-                                            st.markdown("### 🔊 Text-to-Speech")
-                                            st.audio(audio_data, format='audio/mp3')
-                                            
-                                            st.download_button(
-                                                label="💾 Download Audio",
-                                                data=audio_data,
-                                                file_name="analysis_en.mp3",
-                                                mime="audio/mp3"
-                                            )
+                                    st.session_state.extracted_text = results["analysis"]
+                                    if results["translation"]:
+                                        st.session_state.translated_text = results["translation"]
                         else:
                             # Just display the previously processed results
                             st.markdown("### 🔍 Analysis (English):")
@@ -480,30 +537,10 @@ def main():
                                 st.write(translated_analysis)
                                 
                                 # Generate audio with translated text
-                                audio_data = generate_audio(translated_analysis, languages[selected_language])
-                                if audio_data:
-                                    st.markdown("### 🔊 Text-to-Speech")
-                                    st.audio(audio_data, format='audio/mp3')
-                                    
-                                    st.download_button(
-                                        label="💾 Download Audio",
-                                        data=audio_data,
-                                        file_name=f"analysis_{selected_language}.mp3",
-                                        mime="audio/mp3"
-                                    )
+                                play_audio(translated_analysis, languages[selected_language], f"analysis_{selected_language}.mp3", title="### 🔊 Text-to-Speech")
                             else:
                                 # English audio
-                                audio_data = generate_audio(st.session_state.extracted_text, 'en')
-                                if audio_data:
-                                    st.markdown("### 🔊 Text-to-Speech")
-                                    st.audio(audio_data, format='audio/mp3')
-                                    
-                                    st.download_button(
-                                        label="💾 Download Audio",
-                                        data=audio_data,
-                                        file_name="analysis_en.mp3",
-                                        mime="audio/mp3"
-                                    )
+                                play_audio(st.session_state.extracted_text, 'en', "analysis_en.mp3", title="### 🔊 Text-to-Speech")
             except Exception as e:
                 st.error(f"Error processing camera image: {str(e)}")
                 import traceback
@@ -511,8 +548,8 @@ def main():
     
     # File upload
     uploaded_file = st.file_uploader(
-        "Or choose an image...", 
-        type=["jpg", "jpeg", "png", "bmp"]
+        "Or choose an image or PDF...", 
+        type=["jpg", "jpeg", "png", "bmp", "pdf"]
     )
     
     if uploaded_file is not None:
@@ -525,11 +562,19 @@ def main():
                 if uploaded_file.name != st.session_state.processed_image.name:
                     new_image = True
             
-            image = Image.open(uploaded_file).convert("RGB")  # Ensure RGB mode
+            if uploaded_file.name.lower().endswith(".pdf"):
+                if not docling_available:
+                    st.error("PDF support requires the SmolDocling dependencies")
+                    return
+                pages = docling_engine.render_pdf(uploaded_file.getvalue())
+            else:
+                pages = [Image.open(uploaded_file).convert("RGB")]  # Ensure RGB mode
+            image = pages[0]
             col1, col2 = st.columns(2)
             
             with col1:
-                st.image(image, caption="Uploaded Image", use_container_width=True)
+                caption = "Uploaded Image" if len(pages) == 1 else f"Page 1 of {len(pages)}"
+                st.image(image, caption=caption, use_container_width=True)
             
             with col2:
                 # Store the selected language for this analysis
@@ -538,41 +583,41 @@ def main():
                 
                 # Only process if it's a new image or hasn't been processed before
                 if new_image or not st.session_state.has_processed:
-                    with st.spinner("Processing with SmolDocling..."):
-                        doctags, md_content, processing_time = process_image_docling(image, task_type)
-                        if doctags and md_content:
-                            # Store in session state
-                            st.session_state.extracted_text = md_content
-                            st.session_state.processed_image = uploaded_file
-                            st.session_state.has_processed = True
-                            
-                            st.markdown("### 📄 SmolDocling Results:")
-                            st.markdown(md_content)
-                            
+                    # SmolDocling and Gemini run side by side; translation starts per chunk
+                    results = run_pipeline(
+                        image,
+                        pages=pages,
+                        prompt_text=task_type,
+                        question=DEFAULT_QUESTION if langchain_available and GOOGLE_API_KEY else None,
+                        language_code=languages[selected_language],
+                        translation_title=f"### 🌐 Results in {selected_language}:"
+                    )
+                    md_content = results["markdown"]
+                    if results["doctags"] and md_content:
+                        # Store in session state
+                        st.session_state.extracted_text = md_content
+                        st.session_state.image_analysis = results["analysis"]
+                        st.session_state.processed_image = uploaded_file
+                        st.session_state.has_processed = True
+                        
+                        st.download_button(
+                            label="💾 Download Markdown",
+                            data=md_content,
+                            file_name="docling_results.md",
+                            mime="text/markdown"
+                        )
+                        
+                        st.success(f"Processing completed in {results['seconds']:.2f} seconds")
+                        
+                        translated_text = results["translation"]
+                        if translated_text:
+                            st.session_state.translated_text = translated_text
                             st.download_button(
-                                label="💾 Download Markdown",
-                                data=md_content,
-                                file_name="docling_results.md",
-                                mime="text/markdown"
+                                label=f"💾 Download {selected_language} Text",
+                                data=translated_text,
+                                file_name=f"translated_results_{selected_language}.txt",
+                                mime="text/plain"
                             )
-                            
-                            st.success(f"Processing completed in {processing_time:.2f} seconds")
-                            
-                            # Translate if a non-English language is selected
-                            if selected_language != "English":
-                                with st.spinner(f"Translating to {selected_language}..."):
-                                    translated_text = translate_text(md_content, languages[selected_language])
-                                    if translated_text:
-                                        st.session_state.translated_text = translated_text
-                                        st.markdown(f"### 🌐 Results in {selected_language}:")
-                                        st.markdown(translated_text)
-                                        
-                                        st.download_button(
-                                            label=f"💾 Download {selected_language} Text",
-                                            data=translated_text,
-                                            file_name=f"translated_results_{selected_language}.txt",
-                                            mime="text/plain"
-                                        )
                 else:
                     # Just display the previously processed results
                     st.markdown("### 📄 SmolDocling Results:")
@@ -585,6 +630,10 @@ def main():
                         mime="text/markdown"
                     )
                     
+                    if st.session_state.get("image_analysis"):
+                        st.markdown("### 🔍 Analysis (English):")
+                        st.write(st.session_state.image_analysis)
+                    
                     # Check if we need to translate or use cached translation
                     if selected_language != "English":
                         # If language changed or no translation available, translate again
@@ -621,20 +670,7 @@ def main():
                 
                 # Generate audio button
                 if st.button("Generate Audio"):
-                    with st.spinner("Generating audio..."):
-                        audio_data = generate_audio(
-                            text_to_process, 
-                            languages[selected_language]
-                        )
-                        if audio_data:
-                            st.audio(audio_data, format='audio/mp3')
-                            
-                            st.download_button(
-                                label="💾 Download Audio",
-                                data=audio_data,
-                                file_name=f"audio_{selected_language}.mp3",
-                                mime="audio/mp3"
-                            )
+                    play_audio(text_to_process, languages[selected_language], f"audio_{selected_language}.mp3")
             
             # Chat interface for analysis
             if langchain_available and st.session_state.chain and st.session_state.extracted_text:
@@ -649,15 +685,11 @@ def main():
                         
                         # Translate assistant responses if needed
                         if role == "🤖 Assistant" and selected_language != "English":
-                            content_key = f"{hash(content)}_{languages[selected_language]}"
-                            if content_key in st.session_state.translation_cache:
-                                content = st.session_state.translation_cache[content_key]
-                            else:
-                                with st.spinner(f"Translating to {selected_language}..."):
-                                    translated_content = translate_text(content, languages[selected_language])
-                                    if translated_content:
-                                        content = translated_content
-                                        st.session_state.translation_cache[content_key] = translated_content
+                            # Repeat renders are served from the shared translation cache
+                            with st.spinner(f"Translating to {selected_language}..."):
+                                translated_content = translate_text(content, languages[selected_language])
+                                if translated_content:
+                                    content = translated_content
                         
                         st.write(f"**{role}:** {content}")
                 
@@ -0,0 +1,89 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "6"))
+
+
+class StageTimer:
+    """Busy time and wall-clock span of every call made for one stage"""
+
+    def __init__(self):
+        self.calls = 0
+        self.busy_seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, start_time, end_time):
+        self.calls += 1
+        self.busy_seconds += end_time - start_time
+        self.first_start = start_time if self.first_start is None else min(self.first_start, start_time)
+        self.last_end = end_time if self.last_end is None else max(self.last_end, end_time)
+
+
+class Pipeline:
+    """Runs stages concurrently on a thread pool and hands their output back to one thread.
+
+    submit() schedules a stage function; a running stage may emit() partial
+    output and submit() follow-up stages (e.g. translate a chunk, then speak
+    it). events() is iterated on the caller's thread, the Streamlit script
+    thread, so only that thread touches the UI. It yields (kind, stage,
+    payload) tuples: "partial" from emit(), "result" with a stage's return
+    value and "error" with its exception, until no stage is left.
+    """
+
+    def __init__(self, workers=PIPELINE_WORKERS):
+        self.started = time.time()
+        self.timings = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._events = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, stage, fn, *args, **kwargs):
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._run, stage, fn, args, kwargs)
+
+    def emit(self, stage, payload):
+        self._events.put(("partial", stage, payload))
+
+    def _run(self, stage, fn, args, kwargs):
+        start_time = time.time()
+        try:
+            self._events.put(("result", stage, fn(*args, **kwargs)))
+        except Exception as e:
+            print(f"Pipeline stage {stage} failed: {str(e)}")
+            self._events.put(("error", stage, e))
+        finally:
+            with self._lock:
+                self.timings.setdefault(stage, StageTimer()).record(start_time, time.time())
+                # Follow-up stages were submitted inside fn, so pending cannot hit zero early.
+                self._pending -= 1
+
+    def events(self):
+        try:
+            while True:
+                try:
+                    yield self._events.get(timeout=0.05)
+                except queue.Empty:
+                    with self._lock:
+                        if self._pending == 0 and self._events.empty():
+                            return
+        finally:
+            self._executor.shutdown(wait=False)
+
+    def timing_summary(self):
+        """{stage: {calls, busy_seconds, start, end}} with start/end relative to the pipeline start"""
+        with self._lock:
+            return {
+                stage: {
+                    "calls": timer.calls,
+                    "busy_seconds": round(timer.busy_seconds, 3),
+                    "start": round(timer.first_start - self.started, 3),
+                    "end": round(timer.last_end - self.started, 3),
+                }
+                for stage, timer in self.timings.items()
+            }
@@ -0,0 +1,130 @@
+import os
+import threading
+from io import BytesIO
+from collections import OrderedDict
+import numpy as np
+from PIL import Image, ImageChops, ImageOps
+from result_cache import content_hash
+
+DESCRIBE_TASK = "describe"
+# Longest edge worth sending per task. SmolDocling's processor works on at most
+# 2048px (4x512 tiles), so anything larger only costs time; formulas, charts and
+# header extraction need less detail; Gemini descriptions need far less.
+TASK_MAX_EDGE = {
+    "Convert this page to docling.": 2048,
+    "Convert this table to OTSL.": 2048,
+    "Convert code to text.": 2048,
+    "Convert formula to latex.": 1024,
+    "Convert chart to OTSL.": 1536,
+    "Extract all section header elements on the page.": 1536,
+    DESCRIBE_TASK: 800,
+}
+DEFAULT_MAX_EDGE = 2048
+JPEG_QUALITY = 85
+# Tasks on scanned or photographed documents, where cropping and deskewing help
+DOCUMENT_TASKS = set(TASK_MAX_EDGE) - {DESCRIBE_TASK}
+# Border pixels closer than this to the corner colour count as background
+BORDER_TOLERANCE = 24
+MAX_SKEW_DEGREES = 5.0
+SKEW_STEP_DEGREES = 0.5
+PREPROCESS_CACHE_ENTRIES = int(os.getenv("PREPROCESS_CACHE_ENTRIES", "8"))
+
+
+class PreparedImage:
+    """An image ready for one task, with its JPEG encoding made on first use"""
+
+    def __init__(self, image, task):
+        self.image = image
+        self.task = task
+        self._jpeg = None
+        self._lock = threading.Lock()
+
+    def jpeg_bytes(self, quality=JPEG_QUALITY):
+        with self._lock:
+            if self._jpeg is None:
+                buffered = BytesIO()
+                self.image.save(buffered, format="JPEG", quality=quality)
+                self._jpeg = buffered.getvalue()
+            return self._jpeg
+
+
+def background_colour(image):
+    corners = [(0, 0), (image.width - 1, 0), (0, image.height - 1), (image.width - 1, image.height - 1)]
+    return tuple(int(np.median([image.getpixel(corner)[channel] for corner in corners])) for channel in range(3))
+
+
+def crop_borders(image, margin=8):
+    """Trim uniform margins (scanner bed, letterboxing); returns the image itself when there are none"""
+    background = Image.new("RGB", image.size, background_colour(image))
+    mask = ImageChops.difference(image, background).convert("L").point(lambda value: 255 if value > BORDER_TOLERANCE else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    left, top, right, bottom = bbox
+    bbox = (max(0, left - margin), max(0, top - margin), min(image.width, right + margin), min(image.height, bottom + margin))
+    # Skip crops that remove almost nothing or almost everything (likely noise).
+    area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    if area > 0.97 * image.width * image.height or area < 0.2 * image.width * image.height:
+        return image
+    return image.crop(bbox)
+
+
+def estimate_skew(image):
+    """Angle in degrees that makes text lines horizontal, from row-profile sharpness"""
+    gray = ImageOps.grayscale(image)
+    gray.thumbnail((600, 600))
+    ink = ImageOps.invert(gray).point(lambda value: 255 if value > 96 else 0)
+    best_angle, best_score = 0.0, None
+    for angle in np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + SKEW_STEP_DEGREES / 2, SKEW_STEP_DEGREES):
+        rows = np.asarray(ink.rotate(float(angle), resample=Image.NEAREST), dtype=np.float32).sum(axis=1)
+        score = float(np.var(rows))
+        if best_score is None or score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def deskew(image):
+    angle = estimate_skew(image)
+    if abs(angle) < SKEW_STEP_DEGREES:
+        return image
+    return image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=background_colour(image))
+
+
+def downscale(image, max_edge):
+    scale = max_edge / max(image.size)
+    if scale >= 1:
+        return image
+    return image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+
+
+def _prepare(image, task):
+    prepared = image if image.mode == "RGB" else image.convert("RGB")
+    if task in DOCUMENT_TASKS:
+        prepared = deskew(crop_borders(prepared))
+    return downscale(prepared, TASK_MAX_EDGE.get(task, DEFAULT_MAX_EDGE))
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def prepare(image, task=DESCRIBE_TASK, image_hash=None):
+    """Crop, deskew (document tasks) and downscale an image for a task.
+
+    The caller's image is never modified; when nothing needs changing it is
+    returned as-is rather than copied. Results, including their JPEG
+    encoding, are kept for the last few (image, task) pairs so reruns and
+    repeat prompts skip the work. Pass image_hash (result_cache.content_hash)
+    when the caller already has it, to avoid hashing the pixels again.
+    """
+    key = (image_hash or content_hash(image), task)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    prepared = PreparedImage(_prepare(image, task), task)
+    with _cache_lock:
+        _cache[key] = prepared
+        while len(_cache) > PREPROCESS_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return prepared
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from PIL import Image
+
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", ".result_cache.sqlite")
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "256"))
+# Size of the difference hash grid; 8 gives a 64-bit perceptual hash
+PHASH_SIZE = 8
+# Bits two perceptual hashes may differ by (per page) and still count as the same image
+PHASH_MAX_DISTANCE = int(os.getenv("RESULT_CACHE_PHASH_DISTANCE", "4"))
+# A perceptual-hash candidate is only accepted if no pixel of its THUMB_SIZE x THUMB_SIZE
+# grayscale thumbnail differs by more than THUMB_MAX_DIFF (0-255) and its aspect ratio
+# matches. Re-encoded copies stay within a few levels; different text pages differ by
+# dozens somewhere even when their averages agree.
+THUMB_SIZE = 32
+THUMB_MAX_DIFF = int(os.getenv("RESULT_CACHE_THUMB_DIFF", "12"))
+ASPECT_TOLERANCE = 0.02
+
+
+def perceptual_hash(image):
+    """64-bit difference hash: survives re-encoding, resizing and small colour shifts"""
+    gray = image.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(PHASH_SIZE):
+        for col in range(PHASH_SIZE):
+            left = pixels[row * (PHASH_SIZE + 1) + col]
+            right = pixels[row * (PHASH_SIZE + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def content_hash(image):
+    """SHA-256 of the decoded RGB pixels, so it is stable across processes and file formats"""
+    rgb = image if image.mode == "RGB" else image.convert("RGB")
+    digest = hashlib.sha256(f"{rgb.width}x{rgb.height}".encode())
+    digest.update(rgb.tobytes())
+    return digest.hexdigest()
+
+
+def thumbnail(image):
+    """'WxH:<hex grayscale pixels>' used to confirm perceptual-hash matches"""
+    gray = image.convert("L").resize((THUMB_SIZE, THUMB_SIZE), Image.BILINEAR)
+    return f"{image.width}x{image.height}:{gray.tobytes().hex()}"
+
+
+def thumbnails_match(first, second):
+    """Same page count, same aspect ratio and near-identical downsampled pixels on every page"""
+    first_pages, second_pages = first.split("|"), second.split("|")
+    if len(first_pages) != len(second_pages):
+        return False
+    for a, b in zip(first_pages, second_pages):
+        if not a or not b:
+            return False
+        (size_a, pixels_a), (size_b, pixels_b) = a.split(":"), b.split(":")
+        width_a, height_a = map(int, size_a.split("x"))
+        width_b, height_b = map(int, size_b.split("x"))
+        if abs(width_a / height_a - width_b / height_b) > ASPECT_TOLERANCE * width_a / height_a:
+            return False
+        diff = np.abs(
+            np.frombuffer(bytes.fromhex(pixels_a), dtype=np.uint8).astype(np.int16)
+            - np.frombuffer(bytes.fromhex(pixels_b), dtype=np.uint8).astype(np.int16)
+        )
+        if diff.max() > THUMB_MAX_DIFF:
+            return False
+    return True
+
+
+def phash_distance(first, second):
+    """Hamming distance between two (possibly multi-page) perceptual hashes"""
+    first_pages, second_pages = first.split("-"), second.split("-")
+    if len(first_pages) != len(second_pages):
+        return PHASH_SIZE * PHASH_SIZE + 1
+    return max(bin(int(a, 16) ^ int(b, 16)).count("1") for a, b in zip(first_pages, second_pages))
+
+
+def image_key(*images, content_hashes=None):
+    """(perceptual hash, SHA-256, thumbnail) for one image or an ordered list of pages.
+
+    Pass content_hashes when the per-page content_hash() values are already known.
+    """
+    content_hashes = content_hashes or [content_hash(image) for image in images]
+    if len(images) == 1:
+        return perceptual_hash(images[0]), content_hashes[0], thumbnail(images[0])
+    phashes = [perceptual_hash(image) for image in images]
+    digest = hashlib.sha256("".join(content_hashes).encode())
+    return "-".join(phashes), digest.hexdigest(), "|".join(thumbnail(image) for image in images)
+
+
+class ResultCache:
+    """Model outputs keyed by image content, task and prompt, kept in SQLite.
+
+    Results are shared by every session and process using the same file.
+    Lookups match exact pixels by default. With near_duplicates=True (photo
+    descriptions, not OCR: text pages all look alike at hash resolution),
+    images whose perceptual hash is within `max_distance` bits are also
+    considered, and a candidate is only returned if its aspect ratio and
+    downsampled pixels confirm it is the same picture re-encoded or resized.
+    The least recently used rows are evicted once the stored values exceed
+    `max_mb`.
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_mb=RESULT_CACHE_MAX_MB, max_distance=PHASH_MAX_DISTANCE):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.create_function("phash_distance", 2, phash_distance, deterministic=True)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                sha256 TEXT NOT NULL,
+                phash TEXT NOT NULL,
+                task TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                thumb TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (sha256, task, prompt)
+            )"""
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(results)")]
+        if "thumb" not in columns:
+            # Files from before thumbnails were stored; their rows only match exactly.
+            self._conn.execute("ALTER TABLE results ADD COLUMN thumb TEXT NOT NULL DEFAULT ''")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_task ON results (task, prompt)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._conn.commit()
+
+    def get(self, key, task, prompt, near_duplicates=False):
+        phash, sha256, thumb = key
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256, value FROM results WHERE sha256 = ? AND task = ? AND prompt = ?",
+                (sha256, task, prompt),
+            ).fetchone()
+            if row is None and near_duplicates:
+                candidates = self._conn.execute(
+                    "SELECT sha256, value, thumb FROM results WHERE task = ? AND prompt = ? "
+                    "AND phash_distance(phash, ?) <= ? ORDER BY phash_distance(phash, ?), accessed DESC",
+                    (task, prompt, phash, self.max_distance, phash),
+                ).fetchall()
+                row = next((candidate[:2] for candidate in candidates if thumbnails_match(thumb, candidate[2])), None)
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE sha256 = ? AND task = ? AND prompt = ?",
+                (time.time(), row[0], task, prompt),
+            )
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[1])
+
+    def put(self, key, task, prompt, value):
+        phash, sha256, thumb = key
+        encoded = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (sha256, phash, task, prompt, value, size, accessed, thumb) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha256, phash, task, prompt, encoded, len(encoded), time.time(), thumb),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT rowid, size FROM results ORDER BY accessed").fetchall()
+        stale = []
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((rowid,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE rowid = ?", stale)
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"entries": count, "mb": size / (1024 * 1024), "hits": self.hits, "misses": self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Process-wide cache instance (Streamlit reruns and sessions share it)"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
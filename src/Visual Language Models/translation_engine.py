@@ -0,0 +1,212 @@
+import os
+import re
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from googletrans import Translator
+
+TRANSLATION_CACHE_PATH = os.getenv("TRANSLATION_CACHE_PATH", ".translation_cache.sqlite")
+# Concurrent requests to the translation service
+TRANSLATION_CONCURRENCY = int(os.getenv("TRANSLATION_CONCURRENCY", "4"))
+# Largest chunk sent in one request (the web endpoint rejects ~5000+ characters)
+MAX_CHUNK_CHARS = int(os.getenv("TRANSLATION_MAX_CHUNK_CHARS", "1500"))
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 0.5
+
+# Sentence ends in Latin and Indic scripts, plus CJK full stops which need no following space
+SENTENCE_END = re.compile(r"(?<=[.!?।॥])\s+|(?<=[。！？])")
+
+
+def split_sentences(line):
+    return [sentence for sentence in SENTENCE_END.split(line) if sentence.strip()]
+
+
+def split_chunks(text, max_chars=MAX_CHUNK_CHARS):
+    """Split text into (chunk, separator) pairs that join back into the original layout.
+
+    Whole lines are packed together up to max_chars, so Markdown structure
+    survives translation; a line longer than that is split on sentence
+    boundaries (and, for a single run-on sentence, on whitespace).
+    """
+    chunks = []
+    current = []
+    size = 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            chunks.append(("\n".join(current), "\n"))
+            current, size = [], 0
+
+    for line in text.split("\n"):
+        if len(line) <= max_chars:
+            if size + len(line) + 1 > max_chars:
+                flush()
+            current.append(line)
+            size += len(line) + 1
+            continue
+        flush()
+        pieces = []
+        for sentence in split_sentences(line):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if pieces and len(pieces[-1]) + len(sentence) + 1 <= max_chars:
+                pieces[-1] += " " + sentence
+            else:
+                pieces.append(sentence)
+        pieces = pieces or [line]
+        chunks.extend((piece, " ") for piece in pieces[:-1])
+        chunks.append((pieces[-1], "\n"))
+    flush()
+    return chunks
+
+
+def join_chunks(chunks):
+    return "".join(text + separator for text, separator in chunks)[:-1]
+
+
+class TranslationCache:
+    """Translations keyed by (SHA-256 of the source text, source language, target language).
+
+    Stored in SQLite so every session and process reuses them.
+    """
+
+    def __init__(self, path=TRANSLATION_CACHE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                digest TEXT NOT NULL,
+                src TEXT NOT NULL,
+                dest TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (digest, src, dest)
+            )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, text, src, dest):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translation FROM translations WHERE digest = ? AND src = ? AND dest = ?",
+                (self._digest(text), src, dest),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, text, src, dest, translation):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                (self._digest(text), src, dest, translation, time.time()),
+            )
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_translation_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TranslationCache()
+        return _cache
+
+
+async def _translate_chunk(translator, semaphore, chunk, src, dest):
+    """Translate one chunk with jittered exponential backoff; None if every attempt failed"""
+    if not chunk.strip():
+        return chunk
+    cache = get_translation_cache()
+    cached = cache.get(chunk, src, dest)
+    if cached is not None:
+        return cached
+    async with semaphore:
+        for attempt in range(MAX_RETRIES):
+            try:
+                # googletrans >= 4.0.2 is async; older releases block, so run those in a thread.
+                translation = translator.translate(chunk, dest=dest, src=src)
+                if asyncio.iscoroutine(translation):
+                    translation = await translation
+                if hasattr(translation, "text"):
+                    cache.put(chunk, src, dest, translation.text)
+                    return translation.text
+                print("Translation failed: No `.text` attribute")
+            except Exception as chunk_error:
+                print(f"Translation error on attempt {attempt+1}: {str(chunk_error)}")
+            if attempt < MAX_RETRIES - 1:
+                await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+    return None
+
+
+class _ThreadedTranslator:
+    """Adapts the blocking googletrans Translator so chunks can run concurrently"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def translate(self, text, dest, src):
+        def run():
+            if not hasattr(self._local, "translator"):
+                self._local.translator = Translator()
+            return self._local.translator.translate(text, dest=dest, src=src)
+        return asyncio.to_thread(run)
+
+
+async def atranslate(text, dest, src="en", concurrency=TRANSLATION_CONCURRENCY):
+    """Translate text chunk by chunk, at most `concurrency` requests at a time, keeping order.
+
+    Chunks that still fail after retries are left untranslated, and the
+    result is then not cached so a later call can try again.
+    """
+    if not text or text.strip() == "" or dest == src:
+        return text
+    cache = get_translation_cache()
+    cached = cache.get(text, src, dest)
+    if cached is not None:
+        return cached
+
+    translator = Translator()
+    if not asyncio.iscoroutinefunction(translator.translate):
+        translator = _ThreadedTranslator()
+    semaphore = asyncio.Semaphore(concurrency)
+    chunks = split_chunks(text)
+    start_time = time.time()
+    translated = await asyncio.gather(
+        *(_translate_chunk(translator, semaphore, chunk, src, dest) for chunk, _ in chunks)
+    )
+    failed = sum(text_out is None for text_out in translated)
+    result = join_chunks([
+        (chunk if text_out is None else text_out, separator)
+        for text_out, (chunk, separator) in zip(translated, chunks)
+    ])
+    print(f"Translated {len(text)} characters in {len(chunks)} chunks to {dest} in {time.time() - start_time:.2f}s"
+          + (f" ({failed} failed)" if failed else ""))
+    if not failed:
+        cache.put(text, src, dest, result)
+    return result
+
+
+def translate(text, dest, src="en", concurrency=TRANSLATION_CONCURRENCY):
+    """Blocking wrapper around atranslate() for the Streamlit script thread"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(atranslate(text, dest, src, concurrency))
+    # Called from inside an event loop: run on a private loop in a worker thread.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, atranslate(text, dest, src, concurrency)).result()
@@ -0,0 +1,73 @@
+import os
+import hashlib
+import tempfile
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from gtts import gTTS
+from translation_engine import split_sentences
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+# Parallel requests to the gTTS endpoint
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", "4"))
+# Sentences are packed into segments of about this many characters
+SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", "400"))
+
+
+def split_segments(text, max_chars=SEGMENT_CHARS):
+    """Group sentences into segments for synthesis.
+
+    The first sentence is kept on its own so the first audio is ready as soon
+    as possible; later segments are packed up to max_chars.
+    """
+    segments = []
+    for line in text.splitlines():
+        for sentence in split_sentences(line.strip()):
+            if len(segments) > 1 and len(segments[-1]) + len(sentence) + 1 <= max_chars:
+                segments[-1] += " " + sentence
+            else:
+                segments.append(sentence)
+    return segments
+
+
+def _cache_path(segment, language_code):
+    digest = hashlib.sha256(segment.encode("utf-8")).hexdigest()
+    return os.path.join(TTS_CACHE_DIR, language_code, f"{digest}.mp3")
+
+
+def synthesize_segment(segment, language_code="en"):
+    """MP3 bytes for one segment, from the disk cache when it has been spoken before"""
+    path = _cache_path(segment, language_code)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return f.read()
+    audio_bytes_io = BytesIO()
+    gTTS(text=segment, lang=language_code, slow=False).write_to_fp(audio_bytes_io)
+    audio = audio_bytes_io.getvalue()
+    # Write to a temp file and rename, so concurrent sessions never read half a file.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(audio)
+    os.replace(tmp_path, path)
+    return audio
+
+
+def iter_audio(text, language_code="en", workers=TTS_WORKERS):
+    """Yield MP3 bytes segment by segment, in reading order.
+
+    All segments are synthesised in parallel; each is yielded as soon as it
+    and every segment before it are done. gTTS returns bare MP3 frames, so
+    the pieces can simply be concatenated.
+    """
+    segments = split_segments(text)
+    if not segments:
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(synthesize_segment, segment, language_code) for segment in segments]
+        for future in futures:
+            yield future.result()
+
+
+def synthesize(text, language_code="en", workers=TTS_WORKERS):
+    """Whole text as one MP3"""
+    return b"".join(iter_audio(text, language_code, workers))